@@ -0,0 +1,106 @@
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    One step of a staged pipeline.
+    :param name: Used in error messages and thread names
+    :param fn: Called with one job, or with a list of jobs when batch_size is set. A batch fn may
+        return {job: exception} for jobs that failed on their own; raising fails the whole batch
+    :param workers: Number of threads running this stage
+    :param batch_size: If set, fn gets up to this many jobs at once (e.g. for bulk API calls)
+    :param batch_wait: Seconds to wait for more jobs before running a partial batch
+    :param always: Run this stage even for jobs that failed earlier (e.g. logging)
+    """
+    name: str
+    fn: Callable
+    workers: int = 1
+    batch_size: int | None = None
+    batch_wait: float = 0.5
+    always: bool = False
+
+
+class Job:
+    """A unit of work flowing through the pipeline. error is set by the first stage that fails."""
+
+    def __init__(self, data):
+        self.data = data
+        self.error = None
+        self.failed_stage = None
+
+
+def _worker(stage: Stage, inbox: queue.Queue, outbox: queue.Queue | None, on_error):
+    done = False
+    while not done:
+        item = inbox.get()
+        if item is _DONE:
+            break
+        jobs = [item]
+        if stage.batch_size:
+            while len(jobs) < stage.batch_size:
+                try:
+                    item = inbox.get(timeout=stage.batch_wait)
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                jobs.append(item)
+        todo = [job for job in jobs if stage.always or job.error is None]
+        if todo:
+            try:
+                if stage.batch_size:
+                    failures = stage.fn(todo) or {}
+                else:
+                    stage.fn(todo[0])
+                    failures = {}
+            except Exception as e:
+                # Only the jobs in this call fail; the rest of the pipeline keeps going
+                failures = dict.fromkeys(todo, e)
+            for job, e in failures.items():
+                if job.error is None:
+                    job.error = e
+                    job.failed_stage = stage.name
+                on_error(job, stage, e)
+        if outbox is not None:
+            for job in jobs:
+                outbox.put(job)
+
+
+def run_pipeline(source, stages: list[Stage], queue_size: int = 16, on_error=lambda job, stage, e: None):
+    """
+    Push every item from source through the stages, each stage running on its own worker
+    threads with a bounded queue in front of it, so a slow stage applies backpressure
+    instead of letting work pile up. Jobs complete in whatever order their stages finish.
+    A job whose stage raises skips the remaining stages except those marked always.
+    :param source: Iterable of items; each is wrapped in a Job
+    :param on_error: Called with (job, stage, exception) whenever a stage fails
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    threads = []
+    for i, stage in enumerate(stages):
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        stage_threads = [
+            threading.Thread(target=_worker, args=(stage, queues[i], outbox, on_error),
+                             name=f"{stage.name}-{n}", daemon=True)
+            for n in range(stage.workers)
+        ]
+        for thread in stage_threads:
+            thread.start()
+        threads.append(stage_threads)
+    try:
+        for item in source:
+            queues[0].put(Job(item))
+    finally:
+        # Shut stages down in order: a stage is told to stop once everything upstream has finished
+        for stage, inbox, stage_threads in zip(stages, queues, threads):
+            for _ in stage_threads:
+                inbox.put(_DONE)
+            for thread in stage_threads:
+                thread.join()
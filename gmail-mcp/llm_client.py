@@ -0,0 +1,174 @@
+"""
+Shared Groq LLM client: one long-lived chat model per API key, so HTTP connections are reused,
+with a cap on concurrent calls, a token-bucket request rate limit and retries with jittered
+backoff on rate-limit (429), server (5xx) and connection errors.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+LLM_MODEL = os.getenv("LLM_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+# Max LLM calls running at once per process (counted separately for sync and async callers)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+# Requests per minute allowed by the provider plan; bursts up to LLM_RATE_BURST are let through
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 30))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", 5))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+
+RETRYABLE_ERRORS = ("APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError")
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second, holding at most capacity tokens."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token and return how long to wait before using it (0 if one was available)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_delay(error: Exception, attempt: int, base_delay: float) -> float:
+    """Honour the provider's Retry-After header if present, else jittered exponential backoff."""
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return float(retry_after)
+    except ValueError:
+        pass
+    return base_delay * (2 ** attempt) * (0.5 + random.random())
+
+
+class LLMClient:
+    """
+    Pooled, rate-limited wrapper around a single ChatGroq instance.
+    invoke/ainvoke/astream mirror the LangChain chat model methods of the same name.
+    """
+
+    def __init__(self, api_key: str, model: str = LLM_MODEL, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 requests_per_minute: float = LLM_REQUESTS_PER_MINUTE, burst: int = LLM_RATE_BURST,
+                 max_retries: int = LLM_MAX_RETRIES, base_delay: float = LLM_RETRY_BASE_DELAY,
+                 timeout: float = LLM_TIMEOUT):
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self._sync_slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        """The underlying ChatGroq model, created on first use."""
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    # Imported here to keep langchain off the import path of callers that never use the LLM
+                    from langchain_groq import ChatGroq
+                    from pydantic.types import SecretStr
+                    # Retries are done here, so they also go through the rate limiter
+                    self._llm = ChatGroq(api_key=SecretStr(self.api_key), model=self.model, max_retries=0,
+                                         timeout=self.timeout)
+        return self._llm
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_slots:
+                self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._async_slots[loop]
+
+    def invoke(self, prompt):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                with self._sync_slots:
+                    return self.llm.invoke(prompt)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_delay(e, attempt, self.base_delay)
+                print(f"LLM call failed ({e}); retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    async def ainvoke(self, prompt):
+        semaphore = self._async_semaphore()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire_async()
+            try:
+                async with semaphore:
+                    return await self.llm.ainvoke(prompt)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_delay(e, attempt, self.base_delay)
+                print(f"LLM call failed ({e}); retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+    async def astream(self, prompt):
+        """Stream response chunks. Only failures before the first chunk are retried."""
+        semaphore = self._async_semaphore()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire_async()
+            started = False
+            try:
+                async with semaphore:
+                    async for chunk in self.llm.astream(prompt):
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                if started or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_delay(e, attempt, self.base_delay)
+                print(f"LLM stream failed ({e}); retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(api_key: str) -> LLMClient:
+    """Return the process-wide client for api_key, creating it on first use."""
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = LLMClient(api_key)
+        return _clients[api_key]
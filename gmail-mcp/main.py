@@ -1,26 +1,143 @@
 import os
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import islice
 from fastmcp import FastMCP, tool
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import HttpError
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
 
-def get_gmail_service():
-    creds = None
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+# Gmail allows up to 100 calls per batch request but recommends at most 50 to avoid rate limiting
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", 50))
+# Rounds of re-sending the calls in a batch that failed with a rate-limit or server error
+GMAIL_BATCH_RETRIES = int(os.getenv("GMAIL_BATCH_RETRIES", 3))
+# Only the headers and fields fetch_unread_emails returns are requested
+METADATA_HEADERS = ["From", "Subject"]
+METADATA_FIELDS = "id,labelIds,snippet,payload/headers"
+# messages().list and history().list page size (Gmail's maximum is 500)
+LIST_PAGE_SIZE = int(os.getenv("GMAIL_LIST_PAGE_SIZE", 500))
+# Where incremental sync keeps its history id checkpoint
+SYNC_STATE_PATH = os.getenv("GMAIL_SYNC_STATE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sync_state.json"))
+# How many later runs retry an email that keeps failing before sync gives up on it
+SYNC_MAX_RETRIES = int(os.getenv("GMAIL_SYNC_MAX_RETRIES", 3))
+# Unread mail under these labels is never synced (messages().list already leaves it out)
+EXCLUDED_LABELS = {"SPAM", "TRASH"}
+# messages().batchModify accepts at most 1000 ids per request
+MODIFY_BATCH_SIZE = 1000
+PROCESSED_LABEL = "Processed"
+
+# Credentials are refreshed once they are this close to expiring
+TOKEN_REFRESH_MARGIN = timedelta(seconds=int(os.getenv("GMAIL_TOKEN_REFRESH_MARGIN", 300)))
+
+_creds = None
+_creds_lock = threading.Lock()
+_discovery_doc = None
+# googleapiclient service objects are not thread-safe, so each thread builds its own
+_local = threading.local()
+
+def _needs_refresh(creds) -> bool:
+    if not creds.valid:
+        return True
+    # expiry is a naive UTC datetime, or None for tokens that never expire
+    return creds.expiry is not None and creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN
+
+def get_credentials():
+    """
+    Return the process-wide Gmail credentials, loading token.json only once.
+    Credentials are refreshed in place when they are about to expire, so every
+    service built from them picks up the new token.
+    """
+    global _creds
+    with _creds_lock:
+        if _creds is None and os.path.exists("token.json"):
+            _creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+        if _creds and not _needs_refresh(_creds):
+            return _creds
+        if _creds and _creds.refresh_token:
+            _creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file(
                 "credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
+            _creds = flow.run_local_server(port=0)
         with open("token.json", "w") as token:
-            token.write(creds.to_json())
-    return build("gmail", "v1", credentials=creds)
+            token.write(_creds.to_json())
+        return _creds
+
+def get_discovery_doc() -> str:
+    """The Gmail v1 discovery document bundled with googleapiclient, read once per process."""
+    global _discovery_doc
+    if _discovery_doc is None:
+        from googleapiclient.discovery_cache import get_static_doc
+        _discovery_doc = get_static_doc("gmail", "v1")
+    return _discovery_doc
+
+def get_gmail_service():
+    """
+    Return this thread's Gmail service, building it on first use from the cached
+    credentials and discovery document (no network round trip).
+    """
+    creds = get_credentials()
+    service = getattr(_local, "service", None)
+    if service is None or _local.creds is not creds:
+        doc = get_discovery_doc()
+        service = build_from_document(doc, credentials=creds) if doc else build("gmail", "v1", credentials=creds)
+        _local.service = service
+        _local.creds = creds
+    return service
+
+def is_retryable_http_error(error: Exception) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429 or error.resp.status >= 500:
+        return True
+    # Gmail reports per-user rate limits as 403 with these reasons
+    return error.resp.status == 403 and any(
+        reason in str(error) for reason in ("rateLimitExceeded", "userRateLimitExceeded"))
+
+def batch_get_messages(service, message_ids: list[str], batch_size: int = GMAIL_BATCH_SIZE,
+                       retries: int = GMAIL_BATCH_RETRIES):
+    """
+    Fetch message metadata with batch HTTP requests, batch_size messages per round trip.
+    Messages that fail with a retryable error are re-sent in a later round with backoff.
+    :return: (messages by id, errors by id for messages that could not be fetched)
+    """
+    messages = {}
+    errors = {}
+    pending = list(message_ids)
+    for attempt in range(retries + 1):
+        retry = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                messages[request_id] = response
+            elif is_retryable_http_error(exception) and attempt < retries:
+                retry.append(request_id)
+            else:
+                errors[request_id] = exception
+
+        for start in range(0, len(pending), batch_size):
+            batch = service.new_batch_http_request(callback=callback)
+            for message_id in pending[start:start + batch_size]:
+                batch.add(
+                    service.users().messages().get(
+                        userId="me", id=message_id, format="metadata",
+                        metadataHeaders=METADATA_HEADERS, fields=METADATA_FIELDS,
+                    ),
+                    request_id=message_id,
+                )
+            batch.execute()
+        if not retry:
+            break
+        pending = retry
+        time.sleep((2 ** attempt) * (0.5 + random.random()))
+    return messages, errors
 
 mcp = FastMCP("Gmail MCP Server")
 
@@ -28,24 +145,154 @@ mcp = FastMCP("Gmail MCP Server")
 def fetch_unread_emails(max_results: int = 5):
     """
     Fetch unread emails from Gmail.
+    Metadata for all messages is fetched with batch requests. Messages that still fail after
+    retries are skipped and stay unread, so the next run picks them up.
     """
     service = get_gmail_service()
-    results = service.users().messages().list(
-        userId="me", labelIds=["UNREAD"], maxResults=max_results
-    ).execute()
-    messages = results.get("messages", [])
-    emails = []
-    for msg in messages:
-        msg_data = service.users().messages().get(userId="me", id=msg["id"]).execute()
-        headers = {h["name"]: h["value"] for h in msg_data["payload"]["headers"]}
-        snippet = msg_data.get("snippet", "")
-        emails.append({
-            "id": msg["id"],
-            "from": headers.get("From"),
-            "subject": headers.get("Subject"),
-            "snippet": snippet,
-        })
-    return emails
+    # Only list as many ids as are used (messages().list pages default to LIST_PAGE_SIZE)
+    message_ids = list(islice(iter_unread_message_ids(service, min(LIST_PAGE_SIZE, max_results)), max_results))
+    fetched, errors = batch_get_messages(service, message_ids)
+    for message_id, error in errors.items():
+        print(f"Error fetching email {message_id}: {error}")
+    return [to_email(fetched[message_id]) for message_id in message_ids if message_id in fetched]
+
+def to_email(msg_data: dict) -> dict:
+    headers = {h["name"]: h["value"] for h in msg_data.get("payload", {}).get("headers", [])}
+    return {
+        "id": msg_data["id"],
+        "from": headers.get("From"),
+        "subject": headers.get("Subject"),
+        "snippet": msg_data.get("snippet", ""),
+    }
+
+def iter_unread_message_ids(service, page_size: int = LIST_PAGE_SIZE):
+    """Yield the ids of all unread messages, newest first, one messages().list page at a time."""
+    page_token = None
+    while True:
+        results = service.users().messages().list(
+            userId="me", labelIds=["UNREAD"], maxResults=page_size, pageToken=page_token,
+            fields="messages/id,nextPageToken",
+        ).execute()
+        for msg in results.get("messages", []):
+            yield msg["id"]
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return
+
+def is_unread_mail(label_ids: list[str]) -> bool:
+    return "UNREAD" in label_ids and not EXCLUDED_LABELS.intersection(label_ids)
+
+def iter_history_message_ids(service, start_history_id: str, page_size: int = LIST_PAGE_SIZE):
+    """
+    Yield the ids of messages that arrived unread or were marked unread since start_history_id,
+    except those in spam or trash.
+    :return: (via StopIteration) the mailbox's latest history id, the next checkpoint
+    :raises HttpError: 404 if start_history_id is too old for Gmail to have its history
+    """
+    page_token = None
+    while True:
+        results = service.users().history().list(
+            userId="me", startHistoryId=start_history_id, historyTypes=["messageAdded", "labelAdded"],
+            maxResults=page_size, pageToken=page_token,
+            fields="history(messagesAdded/message(id,labelIds),labelsAdded(message(id,labelIds),labelIds)),historyId,nextPageToken",
+        ).execute()
+        for record in results.get("history", []):
+            for added in record.get("messagesAdded", []):
+                if is_unread_mail(added["message"].get("labelIds", [])):
+                    yield added["message"]["id"]
+            for added in record.get("labelsAdded", []):
+                if "UNREAD" in added.get("labelIds", []) and not EXCLUDED_LABELS.intersection(added["message"].get("labelIds", [])):
+                    yield added["message"]["id"]
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return results.get("historyId", start_history_id)
+
+def load_sync_state(path: str = SYNC_STATE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_sync_state(state: dict, path: str = SYNC_STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+class MailboxSync:
+    """
+    Incremental sync of unread mail. The first run pages through every unread message;
+    later runs only read the mailbox history since the checkpointed history id, so each run
+    costs O(new mail) instead of O(inbox). Emails that failed are retried on the next run,
+    up to max_retries times; unread mail in spam or trash is skipped.
+
+        sync = MailboxSync()
+        for email in sync.emails():
+            ...
+        sync.commit(failed_ids)
+    """
+
+    def __init__(self, service=None, state_path: str = SYNC_STATE_PATH, batch_size: int = GMAIL_BATCH_SIZE,
+                 max_retries: int = SYNC_MAX_RETRIES):
+        self.service = service or get_gmail_service()
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.state = load_sync_state(state_path)
+        self.next_history_id = self.state.get("history_id")
+        # Failed id -> number of runs it has failed in; older state files kept a plain list
+        retry_ids = self.state.get("retry_ids", {})
+        self.retry_attempts = retry_ids if isinstance(retry_ids, dict) else dict.fromkeys(retry_ids, 1)
+        self.fetch_failed = []
+
+    def message_ids(self):
+        """Yield ids to process: last run's failures first, then new (or, on a full sync, all) unread mail."""
+        yield from self.retry_attempts
+        history_id = self.state.get("history_id")
+        if history_id:
+            try:
+                self.next_history_id = yield from iter_history_message_ids(self.service, history_id)
+                return
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                print(f"History id {history_id} has expired; running a full sync.")
+        # Taken before listing, so mail arriving during the full pass is picked up next run
+        self.next_history_id = self.service.users().getProfile(userId="me", fields="historyId").execute()["historyId"]
+        yield from iter_unread_message_ids(self.service)
+
+    def emails(self):
+        """Yield unread emails as their metadata arrives, batch_size messages per batch request."""
+        seen = set()
+        ids = (message_id for message_id in self.message_ids() if not (message_id in seen or seen.add(message_id)))
+        while chunk := list(islice(ids, self.batch_size)):
+            fetched, errors = batch_get_messages(self.service, chunk, batch_size=self.batch_size)
+            for message_id, error in errors.items():
+                print(f"Error fetching email {message_id}: {error}")
+                # Deleted messages are gone for good; anything else is retried next run
+                if not (isinstance(error, HttpError) and error.resp.status == 404):
+                    self.fetch_failed.append(message_id)
+            for message_id in chunk:
+                msg_data = fetched.get(message_id)
+                # History can name messages that were read or processed since
+                if msg_data is not None and is_unread_mail(msg_data.get("labelIds", [])):
+                    yield to_email(msg_data)
+
+    def commit(self, failed_ids: list[str] = ()):
+        """
+        Save the new checkpoint once the synced emails are handled; failed_ids are retried next run
+        unless they have already been retried max_retries times.
+        """
+        retry_attempts = {}
+        for message_id in dict.fromkeys([*self.fetch_failed, *failed_ids]):
+            attempts = self.retry_attempts.get(message_id, 0) + 1
+            if attempts > self.max_retries:
+                print(f"Giving up on email {message_id} after {attempts} failed runs.")
+            else:
+                retry_attempts[message_id] = attempts
+        self.state = {"history_id": self.next_history_id, "retry_ids": retry_attempts}
+        save_sync_state(self.state, self.state_path)
 
 @mcp.tool()
 def send_email(to: str, subject: str, body: str):
@@ -64,38 +311,57 @@ def send_email(to: str, subject: str, body: str):
     sent = service.users().messages().send(userId="me", body=message_body).execute()
     return {"id": sent["id"], "status": "sent"}
 
+_label_ids = {}  # lowercased label name -> id
+_label_lock = threading.Lock()
+
+def get_label_id(service, name: str) -> str:
+    """
+    Return the id of the label called name (case-insensitive), creating it if needed.
+    All label ids are cached on the first call, so later lookups cost no API calls.
+    """
+    with _label_lock:
+        if not _label_ids:
+            labels = service.users().labels().list(userId="me", fields="labels(id,name)").execute().get('labels', [])
+            _label_ids.update({label['name'].lower(): label['id'] for label in labels})
+        if name.lower() not in _label_ids:
+            label_obj = service.users().labels().create(
+                userId="me",
+                body={"name": name, "labelListVisibility": "labelShow", "messageListVisibility": "show"}
+            ).execute()
+            _label_ids[name.lower()] = label_obj['id']
+        return _label_ids[name.lower()]
+
 @mcp.tool()
 def mark_email_processed(email_id: str):
     """
     Mark an email as processed by removing the UNREAD label and adding a 'Processed' label.
     """
     service = get_gmail_service()
-    # Remove UNREAD label
     service.users().messages().modify(
         userId="me",
         id=email_id,
-        body={"removeLabelIds": ["UNREAD"]}
+        body={"addLabelIds": [get_label_id(service, PROCESSED_LABEL)], "removeLabelIds": ["UNREAD"]}
     ).execute()
-    # Optionally, add a custom 'Processed' label
-    # First, get or create the label
-    labels = service.users().labels().list(userId="me").execute().get('labels', [])
-    processed_label_id = None
-    for label in labels:
-        if label['name'].lower() == 'processed':
-            processed_label_id = label['id']
-            break
-    if not processed_label_id:
-        label_obj = service.users().labels().create(
+    return {"id": email_id, "status": "processed"}
+
+@mcp.tool()
+def mark_emails_processed(email_ids: list[str]):
+    """
+    Mark many emails as processed at once: removes UNREAD and adds the 'Processed' label
+    with one batchModify request per 1000 emails.
+    """
+    service = get_gmail_service()
+    processed_label_id = get_label_id(service, PROCESSED_LABEL)
+    for start in range(0, len(email_ids), MODIFY_BATCH_SIZE):
+        service.users().messages().batchModify(
             userId="me",
-            body={"name": "Processed", "labelListVisibility": "labelShow", "messageListVisibility": "show"}
+            body={
+                "ids": email_ids[start:start + MODIFY_BATCH_SIZE],
+                "addLabelIds": [processed_label_id],
+                "removeLabelIds": ["UNREAD"],
+            }
         ).execute()
-        processed_label_id = label_obj['id']
-    service.users().messages().modify(
-        userId="me",
-        id=email_id,
-        body={"addLabelIds": [processed_label_id]}
-    ).execute()
-    return {"id": email_id, "status": "processed"}
+    return {"ids": email_ids, "status": "processed"}
 
 if __name__ == "__main__":
     mcp.run() 
\ No newline at end of file
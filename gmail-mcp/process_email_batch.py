@@ -1,12 +1,21 @@
 import os
+import re
+import argparse
 import logging
 import json
+import threading
 from datetime import datetime
-from main import fetch_unread_emails, mark_email_processed  # FastMCP Gmail tools
-from rag_engine import retrieve_relevant_policies, generate_response_with_template
+from main import fetch_unread_emails, mark_email_processed, mark_emails_processed, MailboxSync  # FastMCP Gmail tools
+from rag_engine import retrieve_relevant_policies, generate_response_with_template, cache_stats
+from email_pipeline import Stage, run_pipeline
 
 # Configurable batch size
 BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 5))
+# Worker threads per pipeline stage, and the size of the queue in front of each stage
+RETRIEVE_WORKERS = int(os.getenv("RETRIEVE_WORKERS", 4))
+GENERATE_WORKERS = int(os.getenv("GENERATE_WORKERS", 4))
+MARK_BATCH_SIZE = int(os.getenv("MARK_BATCH_SIZE", 100))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 16))
 
 # Setup logging
 os.makedirs("logs", exist_ok=True)
@@ -24,54 +33,130 @@ def log_compliance_entry(entry):
     with open(COMPLIANCE_LOG, "a", encoding="utf-8") as f:
         f.write(json.dumps(entry, ensure_ascii=False) + "\n")
 
-def main():
-    logging.info(f"Fetching up to {BATCH_SIZE} unread emails...")
-    emails = fetch_unread_emails(max_results=BATCH_SIZE)
-    if not emails:
-        logging.info("No unread emails found.")
-        return
-    processed_count = 0
-    error_count = 0
-    for idx, email in enumerate(emails, 1):
-        compliance_entry = {
+class BatchStats:
+    def __init__(self):
+        self.processed = 0
+        self.errors = 0
+        self.failed_ids = []
+        self._lock = threading.Lock()
+
+    def record(self, email_id: str, ok: bool):
+        with self._lock:
+            if ok:
+                self.processed += 1
+            else:
+                self.errors += 1
+                self.failed_ids.append(email_id)
+
+def start_entry(email: dict) -> dict:
+    return {
+        "email": email,
+        "entry": {
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "email_id": email.get('id'),
             "from": email.get('from'),
             "subject": email.get('subject'),
             "snippet": email.get('snippet'),
-        }
-        try:
-            logging.info(f"Processing Email {idx}: From: {email['from']} | Subject: {email['subject']}")
-            # Retrieve relevant policies/templates
-            relevant = retrieve_relevant_policies(email['snippet'], top_k=3)
-            compliance_entry["matched_policies"] = relevant
-            # Prompt for variables if a template is found
-            variables = {}
-            if relevant and all(isinstance(item, dict) for item in relevant):
-                for item in relevant:
-                    if item.get('type') == 'template' and item.get('page_content'):
-                        import re
-                        var_names = set(re.findall(r'\{(\w+)\}', item['page_content']))
-                        for var in var_names:
-                            # For batch, use placeholder or email info (customize as needed)
-                            variables[var] = email.get(var, f"<{var}>")
-                        break
-            # Generate response
-            response = generate_response_with_template(email['snippet'], relevant, variables)
-            compliance_entry["response"] = response
-            compliance_entry["status"] = "processed"
-            logging.info(f"Generated Response for Email {idx}:\n{response}")
-            # Mark email as processed
-            mark_email_processed(email['id'])
-            logging.info(f"Email {idx} marked as processed.")
-            processed_count += 1
-        except Exception as e:
-            logging.error(f"Error processing Email {idx}: {e}")
-            compliance_entry["status"] = "error"
-            compliance_entry["error"] = str(e)
-            error_count += 1
-        log_compliance_entry(compliance_entry)
-    logging.info(f"Batch complete. Processed: {processed_count}, Errors: {error_count}")
+        },
+    }
+
+# --- Pipeline stages. Each gets a Job whose data is {"email": ..., "entry": compliance entry} ---
+
+def retrieve_stage(job):
+    email, entry = job.data["email"], job.data["entry"]
+    logging.info(f"Processing Email {email['id']}: From: {email['from']} | Subject: {email['subject']}")
+    # Retrieve relevant policies/templates
+    entry["matched_policies"] = retrieve_relevant_policies(email['snippet'], top_k=3)
+
+def generate_stage(job):
+    email, entry = job.data["email"], job.data["entry"]
+    relevant = entry["matched_policies"]
+    # Prompt for variables if a template is found
+    variables = {}
+    if relevant and all(isinstance(item, dict) for item in relevant):
+        for item in relevant:
+            if item.get('type') == 'template' and item.get('page_content'):
+                var_names = set(re.findall(r'\{(\w+)\}', item['page_content']))
+                for var in var_names:
+                    # For batch, use placeholder or email info (customize as needed)
+                    variables[var] = email.get(var, f"<{var}>")
+                break
+    # Generate response
+    response = generate_response_with_template(email['snippet'], relevant, variables)
+    entry["response"] = response
+    logging.info(f"Generated Response for Email {email['id']}:\n{response}")
+
+def mark_stage(jobs):
+    # One batchModify for every email that reached this stage together
+    failures = {}
+    try:
+        mark_emails_processed([job.data["email"]["id"] for job in jobs])
+    except Exception as e:
+        # A single bad id (e.g. a deleted message) fails the whole batchModify, so retry one by one
+        # and fail only the emails that really can't be marked
+        logging.warning(f"Marking {len(jobs)} emails as processed failed ({e}); marking them one at a time.")
+        for job in jobs:
+            try:
+                mark_email_processed(job.data["email"]["id"])
+            except Exception as error:
+                failures[job] = error
+    for job in jobs:
+        if job not in failures:
+            job.data["entry"]["status"] = "processed"
+    logging.info(f"{len(jobs) - len(failures)} emails marked as processed.")
+    return failures
+
+def make_log_stage(stats: BatchStats):
+    def log_stage(job):
+        entry = job.data["entry"]
+        if job.error is not None:
+            entry["status"] = "error"
+            entry["error"] = str(job.error)
+        log_compliance_entry(entry)
+        stats.record(job.data["email"]["id"], job.error is None)
+    return log_stage
+
+def on_stage_error(job, stage, error):
+    logging.error(f"Error processing Email {job.data['email'].get('id')} ({stage.name}): {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate responses for unread emails.")
+    parser.add_argument("--sync", action="store_true",
+                        help="Process all mail that arrived since the last --sync run instead of one batch")
+    args = parser.parse_args()
+    if args.sync:
+        # Emails stream in from the history sync while earlier ones are already being processed
+        sync = MailboxSync()
+        logging.info("Syncing unread emails..." if sync.next_history_id is None
+                     else f"Syncing emails since history id {sync.next_history_id}...")
+        emails = sync.emails()
+    else:
+        sync = None
+        logging.info(f"Fetching up to {BATCH_SIZE} unread emails...")
+        emails = fetch_unread_emails(max_results=BATCH_SIZE)
+        if not emails:
+            logging.info("No unread emails found.")
+            return
+    stats = BatchStats()
+    # fetch -> retrieve -> generate -> mark -> log, each stage on its own threads
+    run_pipeline(
+        (start_entry(email) for email in emails),
+        [
+            Stage("retrieve", retrieve_stage, workers=RETRIEVE_WORKERS),
+            Stage("generate", generate_stage, workers=GENERATE_WORKERS),
+            Stage("mark", mark_stage, batch_size=MARK_BATCH_SIZE),
+            Stage("log", make_log_stage(stats), always=True),
+        ],
+        queue_size=PIPELINE_QUEUE_SIZE,
+        on_error=on_stage_error,
+    )
+    if sync is not None:
+        # Only checkpoint once every email is handled; failed ones are retried next run
+        sync.commit(stats.failed_ids)
+    logging.info(f"Batch complete. Processed: {stats.processed}, Errors: {stats.errors}")
+    for name, counters in cache_stats().items():
+        logging.info(f"{name} cache: {counters['hits']} hits, {counters.get('disk_hits', 0)} disk hits, "
+                     f"{counters['misses']} misses")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
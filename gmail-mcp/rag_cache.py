@@ -0,0 +1,342 @@
+"""
+Bounded caches for retrieval results and LLM drafts: LRU eviction in memory, capped by entry
+count and approximate size, with a TTL per entry. Optionally backed by a SQLite file, so entries
+survive restarts and are shared by every process (the MCP server and process_email_batch runs).
+clear() also invalidates the entries other processes hold in memory, within check_interval seconds.
+
+SemanticCache holds drafts keyed by an embedding instead of the exact text, for near-duplicates.
+"""
+import hashlib
+import math
+from array import array
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# How often (seconds) a process checks the database for clear() calls made by other processes
+CACHE_CHECK_INTERVAL = float(os.getenv("RAG_CACHE_CHECK_INTERVAL", 5))
+# Expired and excess rows are pruned from the database once every this many writes
+PRUNE_EVERY = 100
+
+
+def make_key(key) -> str:
+    """Stable digest of a JSON-serializable key, so keys can be long emails or lists of dicts."""
+    raw = json.dumps(key, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _BackedCache:
+    """
+    Shared plumbing of the caches: the optional SQLite connection and the per-namespace
+    generation that clear() bumps, so every process drops entries from before the clear.
+    Subclasses define TABLE and SCHEMA and implement _drop_memory.
+    """
+    TABLE = ""
+    SCHEMA = ""
+
+    def __init__(self, name: str, ttl: float, max_disk_entries: int, db_path: str | None,
+                 check_interval: float):
+        self.name = name
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._db = None
+        self._generation = 0
+        self._checked_at = 0.0
+        self._writes = 0
+        if db_path:
+            try:
+                self._open_db()
+            except sqlite3.Error as e:
+                print(f"Error opening cache database {db_path}: {e}; caching in memory only.")
+                self._db = None
+
+    def _open_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(self.SCHEMA)
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache_generations (namespace TEXT PRIMARY KEY, generation INTEGER)")
+        self._generation = self._db_generation()
+        self._checked_at = time.monotonic()
+
+    def _db_generation(self) -> int:
+        row = self._db.execute("SELECT generation FROM cache_generations WHERE namespace = ?", (self.name,)).fetchone()
+        return row[0] if row else 0
+
+    def _sync_generation(self):
+        """Drop the in-memory entries if another process cleared the cache since the last check."""
+        now = time.monotonic()
+        if self._db is None or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        generation = self._db_generation()
+        if generation != self._generation:
+            self._generation = generation
+            self._drop_memory()
+
+    def _drop_memory(self):
+        raise NotImplementedError
+
+    def _count_write(self):
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self):
+        """Delete expired and stale rows, then the soonest-expiring rows over max_disk_entries."""
+        self._db.execute(
+            f"DELETE FROM {self.TABLE} WHERE namespace = ? AND (expires_at <= ? OR generation != ?)",
+            (self.name, time.time(), self._generation),
+        )
+        self._db.execute(
+            f"DELETE FROM {self.TABLE} WHERE namespace = ? AND rowid IN (SELECT rowid FROM {self.TABLE} "
+            "WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.name, self.name, self.max_disk_entries),
+        )
+
+    def clear(self):
+        """Drop every entry, in this process and (via the database) in every other process."""
+        with self._lock:
+            self._drop_memory()
+            if self._db is None:
+                return
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._generation = self._db_generation() + 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache_generations (namespace, generation) VALUES (?, ?)",
+                    (self.name, self._generation),
+                )
+                self._db.execute(f"DELETE FROM {self.TABLE} WHERE namespace = ?", (self.name,))
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                print(f"Error clearing cache {self.name}: {e}")
+
+
+class TTLCache(_BackedCache):
+    """
+    Thread-safe LRU cache with per-entry TTL. Values must be JSON-serializable; None is never cached.
+    :param name: Namespace of this cache's rows in the database
+    :param ttl: Seconds an entry stays valid
+    :param max_entries: Max entries held in memory
+    :param max_bytes: Max total size of the values held in memory (as JSON)
+    :param db_path: SQLite file backing the cache; None keeps it in memory only
+    :param max_disk_entries: Max rows kept in the database (default 10 * max_entries)
+    """
+    TABLE = "cache_entries"
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS cache_entries (namespace TEXT, key TEXT, value TEXT, expires_at REAL, "
+              "generation INTEGER, PRIMARY KEY (namespace, key))")
+
+    def __init__(self, name: str, ttl: float, max_entries: int, max_bytes: int, db_path: str | None = None,
+                 max_disk_entries: int | None = None, check_interval: float = CACHE_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        super().__init__(name, ttl, max_disk_entries or max_entries * 10, db_path, check_interval)
+
+    def _drop_memory(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remember(self, key: str, value, expires_at: float, size: int):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        key = make_key(key)
+        now = time.time()
+        with self._lock:
+            try:
+                self._sync_generation()
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[1] > now:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return entry[0]
+                    self._bytes -= self._entries.pop(key)[2]
+                if self._db is not None:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ? "
+                        "AND expires_at > ? AND generation = ?",
+                        (self.name, key, now, self._generation),
+                    ).fetchone()
+                    if row is not None:
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1], len(row[0]))
+                        self.disk_hits += 1
+                        return value
+            except sqlite3.Error as e:
+                print(f"Error reading cache {self.name}: {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if value is None:
+            return
+        key = make_key(key)
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at, len(raw))
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, generation) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.name, key, raw, expires_at, self._generation),
+                )
+                self._count_write()
+            except sqlite3.Error as e:
+                print(f"Error writing cache {self.name}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+def normalize_vector(vector) -> array:
+    """Unit-length float32 copy of vector, so cosine similarity is a plain dot product."""
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return array("f", (x / norm for x in vector))
+
+
+class SemanticCache(_BackedCache):
+    """
+    Thread-safe cache of values looked up by embedding similarity, within groups of entries
+    that share a group key (e.g. the set of matched policies). Each group keeps its newest
+    max_per_group entries; the least recently used groups are dropped past max_groups.
+    :param threshold: Min cosine similarity for a hit
+    """
+    TABLE = "semantic_entries"
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS semantic_entries (namespace TEXT, group_key TEXT, vector BLOB, "
+              "value TEXT, expires_at REAL, generation INTEGER, created_at REAL)")
+
+    def __init__(self, name: str, ttl: float, threshold: float, max_per_group: int = 200, max_groups: int = 500,
+                 db_path: str | None = None, max_disk_entries: int | None = None,
+                 check_interval: float = CACHE_CHECK_INTERVAL):
+        self.threshold = threshold
+        self.max_per_group = max_per_group
+        self.max_groups = max_groups
+        self._groups = OrderedDict()  # group key -> (loaded_at, [(vector, value, expires_at), ...] newest last)
+        self.hits = 0
+        self.misses = 0
+        super().__init__(name, ttl, max_disk_entries or max_per_group * max_groups, db_path, check_interval)
+        if self._db is not None:
+            self._db.execute("CREATE INDEX IF NOT EXISTS semantic_entries_group ON semantic_entries (namespace, group_key)")
+
+    def _drop_memory(self):
+        self._groups.clear()
+
+    def _load_group(self, group_key: str) -> list:
+        """The group's entries, re-read from the database every check_interval to pick up other processes' writes."""
+        now = time.monotonic()
+        loaded = self._groups.get(group_key)
+        if loaded is not None and (self._db is None or now - loaded[0] < self.check_interval):
+            self._groups.move_to_end(group_key)
+            return loaded[1]
+        entries = loaded[1] if loaded is not None else []
+        if self._db is not None:
+            rows = self._db.execute(
+                "SELECT vector, value, expires_at FROM semantic_entries WHERE namespace = ? AND group_key = ? "
+                "AND expires_at > ? AND generation = ? ORDER BY created_at DESC LIMIT ?",
+                (self.name, group_key, time.time(), self._generation, self.max_per_group),
+            ).fetchall()
+            entries = []
+            for vector, value, expires_at in reversed(rows):
+                entry_vector = array("f")
+                entry_vector.frombytes(vector)
+                entries.append((entry_vector, json.loads(value), expires_at))
+        self._groups[group_key] = (now, entries)
+        self._groups.move_to_end(group_key)
+        while len(self._groups) > self.max_groups:
+            self._groups.popitem(last=False)
+        return entries
+
+    def get(self, group_key, vector) -> tuple:
+        """Return (value, similarity) of the most similar entry in the group, or (None, best similarity)."""
+        group_key = make_key(group_key)
+        query = normalize_vector(vector)
+        now = time.time()
+        with self._lock:
+            best, best_score = None, 0.0
+            try:
+                self._sync_generation()
+                for entry_vector, value, expires_at in self._load_group(group_key):
+                    if expires_at <= now or len(entry_vector) != len(query):
+                        continue
+                    score = sum(a * b for a, b in zip(query, entry_vector))
+                    if score > best_score:
+                        best, best_score = value, score
+            except sqlite3.Error as e:
+                print(f"Error reading cache {self.name}: {e}")
+            if best is not None and best_score >= self.threshold:
+                self.hits += 1
+                return best, best_score
+            self.misses += 1
+            return None, best_score
+
+    def set(self, group_key, vector, value):
+        if value is None:
+            return
+        group_key = make_key(group_key)
+        vector = normalize_vector(vector)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            try:
+                entries = self._load_group(group_key)
+                entries.append((vector, value, expires_at))
+                del entries[:-self.max_per_group]
+                if self._db is not None:
+                    self._db.execute(
+                        "INSERT INTO semantic_entries (namespace, group_key, vector, value, expires_at, generation, "
+                        "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (self.name, group_key, vector.tobytes(), json.dumps(value, ensure_ascii=False), expires_at,
+                         self._generation, time.time()),
+                    )
+                    self._count_write()
+            except sqlite3.Error as e:
+                print(f"Error writing cache {self.name}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "groups": len(self._groups),
+                "entries": sum(len(entries) for _, entries in self._groups.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
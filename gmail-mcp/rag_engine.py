@@ -5,8 +5,8 @@ from langchain_nomic import NomicEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from pydantic.types import SecretStr
+from llm_client import get_llm_client
+from rag_cache import TTLCache, SemanticCache
 import re
 
 load_dotenv()
@@ -42,9 +42,89 @@ except Exception as e:
 # 3. Text splitter for policies/templates
 splitter = RecursiveCharacterTextSplitter(chunk_size=256, chunk_overlap=0)
 
-# Simple in-memory caches
-_semantic_search_cache = {}
-_llm_response_cache = {}
+# Retrieval results and drafts are cached in memory and, unless RAG_CACHE_PATH is set to "",
+# in a SQLite file shared by the MCP server and batch runs. Both are cleared on re-ingest.
+RAG_CACHE_PATH = os.getenv("RAG_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rag_cache.sqlite3"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 2000))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+# Max size of each cache's in-memory values
+RAG_CACHE_MAX_MB = float(os.getenv("RAG_CACHE_MAX_MB", 32))
+# Drafts are reused for near-duplicate emails (same matched policies, similar normalized body)
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+
+_semantic_search_cache = TTLCache("search", SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES,
+                                  int(RAG_CACHE_MAX_MB * 1024 * 1024), RAG_CACHE_PATH or None)
+_llm_response_cache = TTLCache("response", RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES,
+                               int(RAG_CACHE_MAX_MB * 1024 * 1024), RAG_CACHE_PATH or None)
+_similar_draft_cache = SemanticCache("similar_response", RESPONSE_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD,
+                                     db_path=RAG_CACHE_PATH or None)
+
+def invalidate_caches():
+    """Drop cached retrievals and drafts, e.g. after policies/templates change."""
+    _semantic_search_cache.clear()
+    _llm_response_cache.clear()
+    _similar_draft_cache.clear()
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the retrieval and draft caches."""
+    return {
+        "search": _semantic_search_cache.stats(),
+        "response": _llm_response_cache.stats(),
+        "similar_response": _similar_draft_cache.stats(),
+    }
+
+# Customer-specific details that differ between otherwise identical emails. They are replaced by
+# {name} placeholders in cached drafts and re-filled from the next email that reuses the draft.
+ENTITY_PATTERNS = {
+    "order_number": re.compile(r'(?i:\b(?:order|ticket|case|invoice|ref(?:erence)?)\b\s*(?:number|no\.?|id)?\s*[:#]?\s*)'
+                               # At least 3 characters: drafts are templatized by replacing the value everywhere,
+                               # so "order 1" must not turn every standalone 1 into a placeholder
+                               r'((?=[A-Za-z0-9-]{3})[A-Za-z0-9-]*\d[A-Za-z0-9-]*)'),
+    "email": re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'),
+    "name": re.compile(r'(?i:\b(?:thanks|thank you|regards|best|cheers|sincerely)\b)[\s,.!-]*([A-Z][a-z]+(?: [A-Z][a-z]+)?)\s*$'),
+}
+ENTITY_NAMES = {*ENTITY_PATTERNS, "first_name"}
+GREETING = re.compile(r'^\s*(?:hi|hello|hey|dear)\b[^,\n]*[,\n]', re.IGNORECASE)
+
+def extract_email_entities(email_content: str) -> dict:
+    """Order number, email address and sign-off name found in the email, where present."""
+    entities = {}
+    for name, pattern in ENTITY_PATTERNS.items():
+        match = pattern.search(email_content)
+        if match:
+            entities[name] = match.group(match.lastindex or 0)
+    if "name" in entities:
+        entities["first_name"] = entities["name"].split()[0]
+    return entities
+
+def normalize_email(email_content: str, entities: dict) -> str:
+    """
+    Email body without greeting, sign-off or customer details, for near-duplicate matching.
+    Other numbers (amounts, dates) are kept: drafts quote them, so they must match exactly.
+    """
+    text = GREETING.sub("", email_content)
+    name_match = ENTITY_PATTERNS["name"].search(text)
+    if name_match:
+        text = text[:name_match.start()]
+    for name, value in sorted(entities.items(), key=lambda item: -len(item[1])):
+        text = text.replace(value, f"<{name}>")
+    return " ".join(re.sub(r'[^\w<>\s]', ' ', text.lower()).split())
+
+def templatize_draft(draft: str, entities: dict) -> str:
+    """Replace the email's customer details in a draft with {name} placeholders."""
+    for name, value in sorted(entities.items(), key=lambda item: -len(item[1])):
+        draft = re.sub(rf'(?<!\w){re.escape(value)}(?!\w)', f"{{{name}}}", draft)
+    return draft
+
+def reuse_similar_draft(draft_template: str, entities: dict) -> str | None:
+    """Fill a cached draft's placeholders from this email, or None if it lacks a detail the draft needs."""
+    placeholders = set(re.findall(r'\{(\w+)\}', draft_template))
+    if placeholders & ENTITY_NAMES - entities.keys():
+        return None
+    return fill_template(draft_template, entities)
 
 def embed_and_index_policies(policies: list[dict]):
     """
@@ -73,6 +153,9 @@ def embed_and_index_policies(policies: list[dict]):
         vector_store.add_texts(texts, metadatas=metadatas)
     except Exception as e:
         print(f"Error upserting to Pinecone: {e}")
+        return
+    # Cached results may point at outdated policies
+    invalidate_caches()
 
 def retrieve_relevant_policies(query: str, top_k: int = 3):
     """
@@ -82,8 +165,9 @@ def retrieve_relevant_policies(query: str, top_k: int = 3):
     :return: List of dicts with 'page_content' and metadata
     """
     cache_key = (query, top_k)
-    if cache_key in _semantic_search_cache:
-        return _semantic_search_cache[cache_key]
+    cached = _semantic_search_cache.get(cache_key)
+    if cached is not None:
+        return cached
     if not vector_store:
         print("Pinecone vector store not initialized.")
         return []
@@ -93,26 +177,47 @@ def retrieve_relevant_policies(query: str, top_k: int = 3):
             {"page_content": doc.page_content, **(doc.metadata if hasattr(doc, 'metadata') else {})}
             for doc in results
         ]
-        _semantic_search_cache[cache_key] = out
+        _semantic_search_cache.set(cache_key, out)
         return out
     except Exception as e:
         print(f"Error querying Pinecone: {e}")
         return []
 
-def generate_draft_response(email_content: str, relevant_policies: list[str]) -> str:
+def generate_draft_response(email_content: str, relevant_policies: list[str], policy_ids: list | None = None) -> str:
     """
     Generate a draft response using Groq LLM and relevant policies/templates, with caching.
+    Besides exact repeats, a draft is reused for a near-duplicate email matching the same policies.
     :param email_content: The incoming email content
     :param relevant_policies: List of relevant policy/template texts
+    :param policy_ids: Ids of the matched policies; if omitted, the texts identify them
     :return: Draft response string
     """
-    cache_key = (email_content, tuple(relevant_policies))
-    if cache_key in _llm_response_cache:
-        return _llm_response_cache[cache_key]
+    cache_key = (email_content, list(relevant_policies))
+    cached = _llm_response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    entities = extract_email_entities(email_content)
+    policy_key = sorted({str(policy_id) for policy_id in policy_ids}) if policy_ids else list(relevant_policies)
+    email_vector = None
+    if SEMANTIC_CACHE:
+        normalized = normalize_email(email_content, entities)
+        # Only emails quoting the same numbers share drafts; embeddings barely tell "$49" from "$120"
+        policy_key = [policy_key, re.findall(r'\d+', normalized)]
+        try:
+            email_vector = embeddings.embed_query(normalized)
+        except Exception as e:
+            print(f"Error embedding email for the draft cache: {e}")
+    if email_vector is not None:
+        draft_template, similarity = _similar_draft_cache.get(policy_key, email_vector)
+        response = reuse_similar_draft(draft_template, entities) if draft_template is not None else None
+        if response is not None:
+            print(f"Reusing the draft of a similar email (similarity {similarity:.3f}).")
+            _llm_response_cache.set(cache_key, response)
+            return response
     if not groq_api_key:
         print("GROQ_API_KEY not set in environment.")
         return "[Error: LLM API key not configured.]"
-    llm = ChatGroq(api_key=SecretStr(groq_api_key), model="meta-llama/llama-4-scout-17b-16e-instruct")
+    llm = get_llm_client(groq_api_key)
     prompt = f"""
         You are an automated support agent. Given the following customer email and relevant company policies/templates, draft a response that is accurate, helpful, and policy-compliant.
 
@@ -130,7 +235,9 @@ def generate_draft_response(email_content: str, relevant_policies: list[str]) ->
         response = result.content
     else:
         response = str(result)
-    _llm_response_cache[cache_key] = response
+    _llm_response_cache.set(cache_key, response)
+    if email_vector is not None:
+        _similar_draft_cache.set(policy_key, email_vector, templatize_draft(response, entities))
     return response
 
 def fill_template(template: str, variables: dict) -> str:
@@ -158,4 +265,5 @@ def generate_response_with_template(email_content: str, relevant_policies: list[
     texts = [str(item.get('page_content', '')) for item in relevant_policies]
     if not texts:
         return generate_draft_response(email_content, [''])
-    return generate_draft_response(email_content, texts) 
\ No newline at end of file
+    policy_ids = [item.get('id') for item in relevant_policies]
+    return generate_draft_response(email_content, texts, policy_ids if all(policy_ids) else None) 
\ No newline at end of file
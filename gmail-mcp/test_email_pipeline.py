@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from email_pipeline import Stage, run_pipeline
+
+
+class Recorder:
+    """Log stage that records every job it sees."""
+
+    def __init__(self):
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def __call__(self, job):
+        with self._lock:
+            self.jobs.append(job)
+
+    def by_item(self):
+        return {job.data: job for job in self.jobs}
+
+
+def double(job):
+    job.data *= 2
+
+
+def test_every_job_passes_every_stage():
+    log = Recorder()
+    run_pipeline(range(20), [Stage("double", double, workers=3), Stage("log", log, always=True)], queue_size=2)
+    assert sorted(job.data for job in log.jobs) == [i * 2 for i in range(20)]
+    assert all(job.error is None for job in log.jobs)
+
+
+def test_failing_stage_skips_later_stages_except_always():
+    log = Recorder()
+    reached = []
+
+    def check(job):
+        if job.data % 3 == 0:
+            raise ValueError(f"bad {job.data}")
+
+    errors = []
+    run_pipeline(
+        range(10),
+        [Stage("check", check, workers=2), Stage("next", lambda job: reached.append(job.data)),
+         Stage("log", log, always=True)],
+        on_error=lambda job, stage, e: errors.append((job.data, stage.name)),
+    )
+    jobs = log.by_item()
+    assert len(log.jobs) == 10 and jobs.keys() == set(range(10))
+    assert sorted(reached) == [1, 2, 4, 5, 7, 8]
+    assert sorted(errors) == [(0, "check"), (3, "check"), (6, "check"), (9, "check")]
+    assert str(jobs[3].error) == "bad 3" and jobs[3].failed_stage == "check"
+
+
+def test_failing_batch_fails_only_its_jobs():
+    log = Recorder()
+    batches = []
+
+    def mark(jobs):
+        batches.append([job.data for job in jobs])
+        if 4 in [job.data for job in jobs]:
+            raise RuntimeError("batchModify failed")
+
+    run_pipeline(range(6), [Stage("mark", mark, batch_size=3), Stage("log", log, always=True)])
+    jobs = log.by_item()
+    assert sorted(item for batch in batches for item in batch) == list(range(6))
+    failed_batch = next(batch for batch in batches if 4 in batch)
+    assert {item for item, job in jobs.items() if job.error is not None} == set(failed_batch)
+
+
+def test_batch_stage_can_fail_single_jobs():
+    log = Recorder()
+
+    def mark(jobs):
+        return {job: KeyError(job.data) for job in jobs if job.data == 2}
+
+    run_pipeline(range(5), [Stage("mark", mark, batch_size=5), Stage("log", log, always=True)])
+    jobs = log.by_item()
+    assert [item for item, job in sorted(jobs.items()) if job.error is not None] == [2]
+    assert jobs[2].failed_stage == "mark"
+
+
+def test_source_exception_propagates_after_draining_started_jobs():
+    log = Recorder()
+
+    def source():
+        yield from range(3)
+        raise ConnectionError("history list failed")
+
+    with pytest.raises(ConnectionError):
+        run_pipeline(source(), [Stage("double", double), Stage("log", log, always=True)])
+    assert sorted(job.data for job in log.jobs) == [0, 2, 4]
+
+
+def test_stages_shut_down_in_order():
+    log = Recorder()
+    run_pipeline(range(7), [Stage("mark", lambda jobs: None, batch_size=3, batch_wait=0.01),
+                            Stage("log", log, always=True)])
+    assert len(log.jobs) == 7
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith(("mark-", "log-"))]
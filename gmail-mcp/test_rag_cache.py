@@ -0,0 +1,135 @@
+import sqlite3
+import time
+
+import rag_cache
+from rag_cache import SemanticCache, TTLCache
+
+
+def make_cache(tmp_path=None, **kwargs):
+    kwargs.setdefault("ttl", 60)
+    kwargs.setdefault("max_entries", 10)
+    kwargs.setdefault("max_bytes", 10_000)
+    kwargs.setdefault("check_interval", 0.1)
+    return TTLCache("search", db_path=str(tmp_path / "cache.sqlite3") if tmp_path else None, **kwargs)
+
+
+def test_get_and_set():
+    cache = make_cache()
+    assert cache.get(("refund", 3)) is None
+    cache.set(("refund", 3), [{"page_content": "policy"}])
+    assert cache.get(("refund", 3)) == [{"page_content": "policy"}]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_none_is_not_cached():
+    cache = make_cache()
+    cache.set("key", None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used_past_max_entries():
+    cache = make_cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_past_max_bytes():
+    cache = make_cache(max_bytes=20)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 10
+    # A value larger than the whole budget is not kept in memory at all
+    cache.set("c", "z" * 30)
+    assert cache.get("c") is None
+    assert cache.stats()["bytes"] == 12
+
+
+def test_entries_expire(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.05)
+    cache.set("a", 1)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_entries_survive_restart(tmp_path):
+    make_cache(tmp_path).set("a", {"draft": "hello"})
+    cache = make_cache(tmp_path)
+    assert cache.get("a") == {"draft": "hello"}
+    assert cache.get("a") == {"draft": "hello"}
+    assert cache.stats()["disk_hits"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_clear_invalidates_other_instances(tmp_path):
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first.set("a", 1)
+    assert second.get("a") == 1
+    first.clear()
+    assert first.get("a") is None
+    time.sleep(0.15)
+    assert second.get("a") is None
+    # Entries written after the clear are visible again
+    first.set("b", 2)
+    assert second.get("b") == 2
+    assert make_cache(tmp_path).get("a") is None
+
+
+def test_namespaces_are_independent(tmp_path):
+    search = make_cache(tmp_path)
+    response = TTLCache("response", 60, 10, 10_000, db_path=str(tmp_path / "cache.sqlite3"))
+    search.set("a", 1)
+    response.set("a", 2)
+    search.clear()
+    assert response.get("a") == 2
+
+
+def test_prune_keeps_max_disk_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_cache, "PRUNE_EVERY", 5)
+    cache = make_cache(tmp_path, max_disk_entries=3)
+    for i in range(10):
+        cache.set(i, i)
+    rows = sqlite3.connect(tmp_path / "cache.sqlite3").execute(
+        "SELECT COUNT(*) FROM cache_entries WHERE namespace = 'search'").fetchone()[0]
+    assert rows == 3
+    # The latest writes are the ones kept
+    assert make_cache(tmp_path).get(9) == 9
+
+
+def make_semantic_cache(tmp_path=None, **kwargs):
+    kwargs.setdefault("check_interval", 0.1)
+    return SemanticCache("similar_response", 60, 0.95,
+                         db_path=str(tmp_path / "cache.sqlite3") if tmp_path else None, **kwargs)
+
+
+def test_semantic_cache_matches_similar_vectors():
+    cache = make_semantic_cache()
+    cache.set(["policy-1"], [1.0, 0.0, 0.0], "draft")
+    value, similarity = cache.get(["policy-1"], [0.99, 0.05, 0.0])
+    assert value == "draft" and similarity > 0.95
+    assert cache.get(["policy-1"], [0.0, 1.0, 0.0])[0] is None
+    assert cache.get(["policy-2"], [1.0, 0.0, 0.0])[0] is None
+
+
+def test_semantic_cache_keeps_newest_per_group():
+    cache = make_semantic_cache(max_per_group=2)
+    for i, vector in enumerate([[1, 0, 0], [0, 1, 0], [0, 0, 1]]):
+        cache.set("group", vector, f"draft {i}")
+    assert cache.get("group", [1, 0, 0])[0] is None
+    assert cache.get("group", [0, 0, 1])[0] == "draft 2"
+
+
+def test_semantic_cache_reloads_groups_from_other_instances(tmp_path):
+    first, second = make_semantic_cache(tmp_path), make_semantic_cache(tmp_path)
+    assert second.get("group", [1, 0])[0] is None
+    first.set("group", [1, 0], "draft")
+    time.sleep(0.15)
+    assert second.get("group", [1, 0])[0] == "draft"
+    first.clear()
+    time.sleep(0.15)
+    assert second.get("group", [1, 0])[0] is None
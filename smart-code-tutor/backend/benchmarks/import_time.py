@@ -0,0 +1,61 @@
+"""
+Measure how long it takes to import the backend modules in a fresh interpreter.
+
+    python benchmarks/import_time.py [--runs 5] [--modules rag_engine main] [--output import_time.json]
+
+Each run starts a new Python process so nothing is cached in sys.modules. Prints the median
+and max wall time per module, plus the slowest imports reported by `python -X importtime`.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def time_import(module: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=BACKEND_DIR, check=True,
+                   capture_output=True)
+    return time.perf_counter() - started
+
+def slowest_imports(module: str, top: int = 10) -> list[tuple[str, int]]:
+    """Return the top (package, cumulative microseconds) entries from -X importtime, excluding module itself."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR,
+                          check=True, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)", line)
+        if match and match.group(2) != module:
+            rows.append((match.group(2), int(match.group(1))))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=["rag_engine", "main"])
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        timings = [time_import(module) for _ in range(args.runs)]
+        results[module] = {
+            "runs": args.runs,
+            "median_s": statistics.median(timings),
+            "max_s": max(timings),
+            "slowest_imports_us": slowest_imports(module),
+        }
+        print(f"{module}: median {results[module]['median_s'] * 1000:.0f} ms, max {results[module]['max_s'] * 1000:.0f} ms")
+        for name, micros in results[module]["slowest_imports_us"]:
+            print(f"    {micros / 1000:8.1f} ms  {name}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Load-test the /ws endpoint with fake dependencies.
+
+    python benchmarks/ws_load.py [--clients 20] [--requests 10] [--explain-ratio 0.5] [--stream]
+                                 [--sandbox-latency 0.2] [--llm-latency 0.5] [--output ws_load.json]
+
+Boots the FastAPI app with uvicorn on a local port, replacing the sandbox backend, the Groq
+LLM, the embedding model and the vector store with fakes that sleep for the configured
+latencies. Each client opens one WebSocket and sends its requests one after another, picking
+run or explain at random. Prints throughput and p50/p95/p99 latency per action; --output
+writes the same numbers plus the configuration and git commit as JSON, so runs on different
+commits can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("GROQ_API_KEY", "fake")
+os.environ.setdefault("SANDBOX_BACKEND", "local")
+
+# --- Fakes ---
+
+def jittered(latency: float, jitter: float) -> float:
+    return max(latency * (1 + random.uniform(-jitter, jitter)), 0)
+
+class FakeSandboxBackend:
+    """Sandbox pool backend whose runs sleep instead of executing anything."""
+
+    def __init__(self, latency: float, create_latency: float, jitter: float):
+        self.latency = latency
+        self.create_latency = create_latency
+        self.jitter = jitter
+
+    def create(self, language: str):
+        time.sleep(jittered(self.create_latency, self.jitter))
+        return SimpleNamespace(interrupted=threading.Event(), closed=False)
+
+    def reset(self, handle, language: str):
+        handle.interrupted.clear()
+
+    def run(self, handle, code: str, language: str, timeout: float | None = None):
+        if handle.interrupted.wait(jittered(self.latency, self.jitter)):
+            raise RuntimeError("Interrupted")
+        return SimpleNamespace(logs=SimpleNamespace(stdout=[f"ran {len(code)} chars\n"], stderr=[]))
+
+    def run_streaming(self, handle, code: str, language: str, on_stdout, on_stderr, timeout: float | None = None):
+        for i in range(5):
+            if handle.interrupted.wait(jittered(self.latency, self.jitter) / 5):
+                raise RuntimeError("Interrupted")
+            on_stdout(f"line {i}\n")
+        return SimpleNamespace(logs=SimpleNamespace(stdout=[], stderr=[]))
+
+    def interrupt(self, handle):
+        handle.interrupted.set()
+
+    def is_healthy(self, handle) -> bool:
+        return not handle.closed
+
+    def close(self, handle):
+        handle.interrupted.set()
+        handle.closed = True
+
+class FakeLLM:
+    """Stands in for ChatGroq: ainvoke sleeps for the full latency, astream spreads it over tokens."""
+
+    def __init__(self, latency: float, tokens: int, jitter: float):
+        self.latency = latency
+        self.tokens = tokens
+        self.jitter = jitter
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(jittered(self.latency, self.jitter))
+        return SimpleNamespace(content="other" if "Classify" in prompt else "word " * self.tokens)
+
+    async def astream(self, prompt):
+        delay = jittered(self.latency, self.jitter) / self.tokens
+        for _ in range(self.tokens):
+            await asyncio.sleep(delay)
+            yield SimpleNamespace(content="word ")
+
+class FakeEmbeddings:
+    def __init__(self, latency: float, jitter: float):
+        self.latency = latency
+        self.jitter = jitter
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(jittered(self.latency, self.jitter))
+        rng = random.Random(text)
+        return [rng.uniform(-1, 1) for _ in range(768)]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+class FakeVectorStore:
+    def __init__(self, latency: float, jitter: float):
+        self.latency = latency
+        self.jitter = jitter
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, namespace: str | None = None, **kwargs):
+        time.sleep(jittered(self.latency, self.jitter))
+        return [(SimpleNamespace(page_content=f"{namespace} doc {i}"), 1.0 - i / 10) for i in range(k)]
+
+def install_fakes(args):
+    """Import the app and swap its external dependencies for fakes. Returns the FastAPI app."""
+    import main
+    import rag_engine
+    from bm25_index import BM25Index
+    from sandbox_pool import SandboxPool
+
+    main.sandbox_pool = SandboxPool(
+        FakeSandboxBackend(args.sandbox_latency, args.sandbox_create_latency, args.jitter),
+        min_idle=args.pool_min_idle,
+        max_size=args.pool_size,
+    )
+    llm = FakeLLM(args.llm_latency, args.llm_tokens, args.jitter)
+    main.make_llm = lambda groq_api_key: llm
+    rag_engine._embeddings = FakeEmbeddings(args.embed_latency, args.jitter)
+    rag_engine._vector_store = FakeVectorStore(args.retrieval_latency, args.jitter)
+    rag_engine._keyword_index = BM25Index()
+    for name in ("embeddings", "vector_store"):
+        rag_engine._mark(name, "ready")
+    return main.app
+
+# --- Server ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(app, port: int):
+    """Run uvicorn on its own thread and event loop, so the clients don't share a loop with it."""
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Server failed to start.")
+        time.sleep(0.05)
+    return server, thread
+
+# --- Clients ---
+
+def is_final(frame: dict) -> bool:
+    """True for the last frame of a request: a plain response, a stream's end or a run's exit."""
+    return frame.get("type") not in ("start", "delta", "stdout", "stderr")
+
+async def run_client(url: str, client_no: int, args, latencies: dict, errors: dict):
+    import websockets
+    rng = random.Random(args.seed + client_no)
+    async with websockets.connect(url, max_size=None) as ws:
+        for n in range(args.requests):
+            action = "explain" if rng.random() < args.explain_ratio else "run"
+            request_id = f"{client_no}-{n}"
+            # Unique code per request defeats the execution cache unless --repeat-code is given
+            code = "print('hello')" if args.repeat_code else f"print({client_no * args.requests + n})"
+            payload = {"action": action, "request_id": request_id, "code": code, "language": "python"}
+            if action == "explain":
+                payload.update(output="", error="", user_message=rng.choice([
+                    "explain this code", "why does this fail?", "how do I use enumerate?",
+                ]))
+            if args.stream:
+                payload["stream"] = True
+            started = time.perf_counter()
+            await ws.send(json.dumps(payload))
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame.get("request_id") == request_id and is_final(frame):
+                    break
+            latencies[action].append(time.perf_counter() - started)
+            if frame.get("error") or frame.get("status") in ("error", "timeout", "output_limit"):
+                errors[action] += 1
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except Exception:
+        return None
+
+async def run_load(url: str, args) -> dict:
+    latencies = {"run": [], "explain": []}
+    errors = {"run": 0, "explain": 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client(url, i, args, latencies, errors) for i in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    all_latencies = latencies["run"] + latencies["explain"]
+    return {
+        "elapsed_s": elapsed,
+        "overall": summarize(all_latencies, errors["run"] + errors["explain"], elapsed),
+        "actions": {action: summarize(latencies[action], errors[action], elapsed) for action in latencies},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20, help="Concurrent WebSocket connections")
+    parser.add_argument("--requests", type=int, default=10, help="Requests sent by each client, one at a time")
+    parser.add_argument("--explain-ratio", type=float, default=0.5, help="Fraction of requests that are explain")
+    parser.add_argument("--stream", action="store_true", help="Use streamed run/explain responses")
+    parser.add_argument("--repeat-code", action="store_true", help="Send the same code every time (exercises the execution cache)")
+    parser.add_argument("--sandbox-latency", type=float, default=0.2, help="Seconds per fake sandbox run")
+    parser.add_argument("--sandbox-create-latency", type=float, default=1.0, help="Seconds to create a fake sandbox")
+    parser.add_argument("--pool-size", type=int, default=int(os.getenv("SANDBOX_POOL_MAX_SIZE", 4)))
+    parser.add_argument("--pool-min-idle", type=int, default=int(os.getenv("SANDBOX_POOL_MIN_IDLE", 1)))
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake LLM call")
+    parser.add_argument("--llm-tokens", type=int, default=50, help="Tokens per fake streamed LLM response")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per fake query embedding")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="Seconds per fake vector query")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Fakes vary their latency by +/- this fraction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    app = install_fakes(args)
+    port = free_port()
+    server, thread = start_server(app, port)
+    # Let the pool pre-warm so sandbox creation isn't counted against the first requests
+    time.sleep(args.sandbox_create_latency * 1.5 if args.pool_min_idle else 0)
+    try:
+        results = asyncio.run(run_load(f"ws://127.0.0.1:{port}/ws", args))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    print(f"{args.clients} clients x {args.requests} requests in {results['elapsed_s']:.1f}s "
+          f"({results['overall'].get('throughput_rps', 0):.1f} req/s)")
+    for action, stats in [("all", results["overall"]), *results["actions"].items()]:
+        if stats["count"]:
+            print(f"  {action:8} n={stats['count']:<5} errors={stats['errors']:<4} p50 {stats['p50_ms']:7.1f} ms  "
+                  f"p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "config": vars(args), **results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
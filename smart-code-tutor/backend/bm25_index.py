@@ -0,0 +1,155 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+# Dotted identifiers like Array.prototype.reduce or os.path.join, or plain words/identifiers
+_TOKEN_RE = re.compile(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*|\d+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i", "in", "is", "it",
+    "my", "of", "on", "or", "that", "the", "this", "to", "what", "when", "why", "with", "do", "does",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Identifier-aware tokenizer. Each identifier is kept whole (lowercased) and also split into
+    its dotted, snake_case and camelCase parts, so `Array.prototype.reduce` matches a query for
+    `reduce` and `TypeError` matches both `TypeError` and `type error`.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        word = match.group(0)
+        lower = word.lower()
+        if lower in STOPWORDS:
+            continue
+        tokens.append(lower)
+        parts = set()
+        for segment in word.split("."):
+            if segment.lower() != lower:
+                parts.add(segment.lower())
+            for piece in segment.split("_"):
+                for sub in _CAMEL_RE.findall(piece):
+                    parts.add(sub.lower())
+        parts.discard(lower)
+        tokens.extend(p for p in parts if p and p not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index partitioned by namespace, persisted as JSON.
+    Only the chunk texts are stored on disk; postings are rebuilt on load.
+    """
+
+    def __init__(self, path: str | None = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._texts = defaultdict(dict)  # namespace -> id -> text
+        self._lengths = defaultdict(dict)  # namespace -> id -> token count
+        self._postings = defaultdict(lambda: defaultdict(dict))  # namespace -> token -> id -> term frequency
+        self._total_length = Counter()  # namespace -> summed token count
+        self.dirty = False
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            self._texts.clear()
+            self._lengths.clear()
+            self._postings.clear()
+            self._total_length.clear()
+            for namespace, docs in data.get("docs", {}).items():
+                for id_, text in docs.items():
+                    self._add(id_, text, namespace)
+            self.dirty = False
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"docs": {ns: dict(docs) for ns, docs in self._texts.items()}}
+            self.dirty = False
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _add(self, id_: str, text: str, namespace: str):
+        self._remove(id_, namespace)
+        counts = Counter(tokenize(text))
+        self._texts[namespace][id_] = text
+        self._lengths[namespace][id_] = sum(counts.values())
+        self._total_length[namespace] += self._lengths[namespace][id_]
+        postings = self._postings[namespace]
+        for token, tf in counts.items():
+            postings[token][id_] = tf
+
+    def _remove(self, id_: str, namespace: str):
+        text = self._texts[namespace].pop(id_, None)
+        if text is None:
+            return
+        self._total_length[namespace] -= self._lengths[namespace].pop(id_)
+        postings = self._postings[namespace]
+        for token in set(tokenize(text)):
+            postings[token].pop(id_, None)
+            if not postings[token]:
+                del postings[token]
+
+    def add(self, ids: list[str], texts: list[str], namespace: str | None = None):
+        with self._lock:
+            for id_, text in zip(ids, texts):
+                self._add(id_, text, namespace or "")
+            self.dirty = True
+
+    def delete(self, ids: list[str], namespace: str | None = None):
+        with self._lock:
+            for id_ in ids:
+                self._remove(id_, namespace or "")
+            self.dirty = True
+
+    def missing(self, ids: list[str], namespace: str | None = None) -> list[str]:
+        """Return the ids that are not in the index, e.g. chunks indexed before the index existed."""
+        with self._lock:
+            docs = self._texts.get(namespace or "", {})
+            return [id_ for id_ in ids if id_ not in docs]
+
+    def search(self, query: str, k: int = 10, namespace: str | None = None) -> list[tuple[str, float]]:
+        """Return up to k (text, score) pairs from one namespace, best first."""
+        namespace = namespace or ""
+        with self._lock:
+            docs = self._texts.get(namespace)
+            if not docs:
+                return []
+            n = len(docs)
+            avg_length = self._total_length[namespace] / n
+            postings = self._postings[namespace]
+            lengths = self._lengths[namespace]
+            scores = defaultdict(float)
+            for token in set(tokenize(query)):
+                matches = postings.get(token)
+                if not matches:
+                    continue
+                idf = math.log(1 + (n - len(matches) + 0.5) / (len(matches) + 0.5))
+                for id_, tf in matches.items():
+                    norm = self.k1 * (1 - self.b + self.b * lengths[id_] / avg_length)
+                    scores[id_] += idf * tf * (self.k1 + 1) / (tf + norm)
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(docs[id_], score) for id_, score in top]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """Fuse several best-first rankings of texts: each text scores sum(1 / (k + rank))."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, text in enumerate(ranking, 1):
+            scores[text] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,104 @@
+import ast
+import hashlib
+import json
+import os
+import re
+
+from cache import TTLCache
+
+# Part of the cache key, so bumping it (e.g. after changing the sandbox template) invalidates old runs
+RUNTIME_VERSION = os.getenv("SANDBOX_RUNTIME_VERSION", os.getenv("SANDBOX_BACKEND", "e2b") + "-1")
+
+# Python code importing any of these modules, or any submodule/attribute with one of these names
+# (numpy.random, np.random.rand()), may produce different output on every run, so it is never cached
+PYTHON_NONDETERMINISTIC_NAMES = {
+    "random", "time", "datetime", "uuid", "secrets", "socket", "subprocess", "threading", "multiprocessing",
+    "asyncio", "requests", "urllib", "http", "os", "sys",
+}
+# Iterating a set of strings follows the per-process hash seed, so set/frozenset calls,
+# set literals and set comprehensions count as nondeterministic too
+PYTHON_NONDETERMINISTIC_CALLS = {"input", "open", "__import__", "exec", "eval", "id", "hash", "set", "frozenset"}
+
+# Code matching any of these may produce different output on every run, so it is never cached
+NONDETERMINISTIC_PATTERNS = {
+    "javascript": [
+        r"\bMath\.random\b",
+        r"\bDate\b",
+        r"\bperformance\.now\b",
+        r"\bcrypto\b",
+        r"\b(fetch|prompt|XMLHttpRequest|WebSocket|setInterval)\b",
+        r"\bprocess\.(stdin|env|hrtime|pid)\b",
+        r"""\b(require|import)\s*\(?\s*['"](node:)?(http|https|net|dgram|dns|fs|readline|child_process|os|crypto|worker_threads)['"]""",
+        r"""\bfrom\s+['"](node:)?(http|https|net|dgram|dns|fs|readline|child_process|os|crypto|worker_threads)['"]""",
+    ],
+}
+NONDETERMINISTIC_PATTERNS["typescript"] = NONDETERMINISTIC_PATTERNS["javascript"]
+
+_compiled = {
+    language: [re.compile(pattern) for pattern in patterns]
+    for language, patterns in NONDETERMINISTIC_PATTERNS.items()
+}
+
+def normalize_code(code: str) -> str:
+    """Normalize line endings and trailing whitespace, which never change what the code does."""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+def _python_is_deterministic(code: str) -> bool:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        # Fails with the same error on every run
+        return True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            names = [node.module or ""] + [alias.name for alias in node.names]
+        elif isinstance(node, ast.Attribute):
+            names = [node.attr]
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            names = []
+            if node.func.id in PYTHON_NONDETERMINISTIC_CALLS:
+                return False
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            return False
+        else:
+            continue
+        if any(PYTHON_NONDETERMINISTIC_NAMES.intersection(name.split(".")) for name in names):
+            return False
+    return True
+
+def is_cacheable(code: str, language: str) -> bool:
+    """False if the code uses time, randomness, the network, stdin or other run-dependent state."""
+    if language == "python":
+        return _python_is_deterministic(code)
+    patterns = _compiled.get(language)
+    if patterns is None:
+        return False
+    return not any(pattern.search(code) for pattern in patterns)
+
+def cache_key(code: str, language: str) -> str:
+    digest = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+    return f"{language}:{RUNTIME_VERSION}:{digest}"
+
+def _result_size(result) -> int:
+    return len(json.dumps(result, default=str))
+
+# (language, runtime version, code hash) -> (output, error), bounded by entry count and total bytes
+execution_cache = TTLCache(
+    maxsize=int(os.getenv("EXECUTION_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("EXECUTION_CACHE_TTL", 24 * 3600)),
+    max_weight=int(os.getenv("EXECUTION_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    weigher=_result_size,
+)
+
+def get_cached_result(code: str, language: str):
+    """Return the cached (output, error) for this code, or None on a miss or uncacheable code."""
+    if not is_cacheable(code, language):
+        return None
+    return execution_cache.get(cache_key(code, language))
+
+def store_result(code: str, language: str, result):
+    if is_cacheable(code, language):
+        execution_cache.set(cache_key(code, language), result)
@@ -1,21 +1,163 @@
-from langchain_community.document_loaders import PyPDFLoader
-from rag_engine import embed_and_index_docs
+from concurrent.futures import ProcessPoolExecutor
+from rag_engine import get_splitter, chunk_id, delete_chunks, namespace_for, get_keyword_index, flush_index
+from ingest_pipeline import EmbeddingPipeline, iter_pdf_pages, EXTRACT_WORKERS
+import argparse
+import hashlib
+import json
 import os
+import time
+
+data_dir = os.path.join(os.path.dirname(__file__), 'data')
+
+# Records what is already indexed:
+# {doc_key: {"language": ..., "namespace": ..., "pages": {page_no: {"hash": ..., "chunks": [ids]}}}}
+MANIFEST_PATH = os.path.join(data_dir, 'ingest_manifest.json')
+
+DOCS = [
+    ('Python Fundamentals Documentation.pdf', 'python'),
+    ('JavaScript Fundamentals Documentation.pdf', 'javascript'),
+]
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def entry_chunk_ids(entry: dict) -> list[str]:
+    return [cid for page in entry.get('pages', {}).values() for cid in page['chunks']]
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def sync_document(doc_key: str, pages, language: str, entry: dict, pipeline: EmbeddingPipeline) -> dict:
+    """
+    Bring the index in line with the current pages of one document.
+    Unchanged pages are skipped, changed pages only upsert their new chunks and delete
+    the ones that disappeared, and pages that no longer exist are deleted.
+    :param pages: Iterable of (page_no, text) in any order; each page is split as soon as it arrives
+    :param entry: This document's manifest entry from the previous run (empty on first run)
+    :param pipeline: Pipeline that embeds and upserts the new chunks
+    :return: The updated manifest entry
+    """
+    splitter = get_splitter(language)
+    namespace = namespace_for(language)
+    new_pages = {}
+    stale = []
+    if entry.get('language') == language and entry.get('namespace') == namespace:
+        old_pages = entry.get('pages', {})
+    else:
+        # Indexed under another language or namespace (or not at all): drop it and re-index everything
+        old_pages = {}
+        if entry and not delete_chunks(entry_chunk_ids(entry), namespace=entry.get('namespace')):
+            raise RuntimeError(f"Delete failed for {doc_key}.")
+    keyword_index = get_keyword_index()
+    skipped = 0
+    upserts = 0
+    for page_no, text in pages:
+        key = str(page_no)
+        digest = page_hash(text)
+        old = old_pages.get(key)
+        if old and old['hash'] == digest:
+            new_pages[key] = old
+            skipped += 1
+            # Pages indexed before the BM25 index existed only need their keywords, not new embeddings
+            missing = set(keyword_index.missing(old['chunks'], namespace))
+            if missing:
+                chunks = {chunk_id(language, doc_key, page_no, chunk): chunk for chunk in splitter.split_text(text)}
+                ids = [cid for cid in chunks if cid in missing]
+                keyword_index.add(ids, [chunks[cid] for cid in ids], namespace)
+            continue
+        old_ids = set(old['chunks']) if old else set()
+        chunk_ids = []
+        for chunk in splitter.split_text(text):
+            cid = chunk_id(language, doc_key, page_no, chunk)
+            if cid in chunk_ids:
+                continue
+            chunk_ids.append(cid)
+            if cid not in old_ids:
+                pipeline.add(chunk, {"source": "doc", "language": language, "doc": doc_key, "page": page_no}, cid,
+                             namespace)
+                upserts += 1
+        stale.extend(old_ids - set(chunk_ids))
+        new_pages[key] = {'hash': digest, 'chunks': chunk_ids}
+    for key, old in old_pages.items():
+        if key not in new_pages:
+            stale.extend(old['chunks'])
+    # Nothing is recorded in the manifest until every chunk of the document is upserted
+    pipeline.flush()
+    print(f"  {skipped} unchanged pages, {upserts} chunks upserted, {len(stale)} chunks to delete.")
+    if stale and not delete_chunks(stale, namespace=namespace):
+        raise RuntimeError(f"Delete failed for {doc_key}.")
+    return {'language': language, 'namespace': namespace, 'pages': new_pages}
+
+class PageCounter:
+    """Wraps a page iterator and counts the pages it yields, for throughput reporting."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.count = 0
+
+    def __iter__(self):
+        for page in self.pages:
+            self.count += 1
+            yield page
 
 def main():
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    docs = [
-        (os.path.join(data_dir, 'Python Fundamentals Documentation.pdf'), 'python'),
-        (os.path.join(data_dir, 'JavaScript Fundamentals Documentation.pdf'), 'javascript'),
-    ]
-    for pdf_path, language in docs:
-        print(f"Extracting and ingesting {pdf_path} as {language}...")
-        loader = PyPDFLoader(pdf_path)
-        pages = loader.load()  # This returns a list of Document objects, one per page
-        # Optionally, you can concatenate or further split these
-        page_texts = [doc.page_content for doc in pages]
-        embed_and_index_docs(page_texts, language=language)
-        print(f"Ingested {pdf_path}.")
+    parser = argparse.ArgumentParser(description="Incrementally index the documentation PDFs.")
+    parser.add_argument('--force', action='store_true', help="Delete everything in the manifest and re-embed all docs.")
+    args = parser.parse_args()
+
+    manifest = load_manifest()
+    if args.force:
+        print(f"Force rebuild: deleting {sum(len(entry_chunk_ids(e)) for e in manifest.values())} indexed chunks...")
+        for entry in manifest.values():
+            if not delete_chunks(entry_chunk_ids(entry), namespace=entry.get('namespace')):
+                print("Delete failed; aborting rebuild.")
+                return
+        manifest = {}
+        save_manifest(manifest)
+
+    doc_keys = set()
+    pipeline = EmbeddingPipeline()
+    with ProcessPoolExecutor(max_workers=EXTRACT_WORKERS) as extractor:
+        for filename, language in DOCS:
+            pdf_path = os.path.join(data_dir, filename)
+            doc_keys.add(filename)
+            print(f"Extracting and ingesting {pdf_path} as {language}...")
+            counter = PageCounter(iter_pdf_pages(pdf_path, extractor))
+            chunks_before = pipeline.chunks
+            started = time.perf_counter()
+            try:
+                manifest[filename] = sync_document(filename, counter, language, manifest.get(filename, {}), pipeline)
+            except Exception as e:
+                print(f"Error ingesting {pdf_path}: {e}")
+                pipeline.discard()
+                flush_index()
+                continue
+            # Save after every document so a failure later on keeps the progress made so far
+            flush_index()
+            save_manifest(manifest)
+            elapsed = max(time.perf_counter() - started, 1e-9)
+            chunks = pipeline.chunks - chunks_before
+            print(f"Ingested {pdf_path}: {counter.count} pages ({counter.count / elapsed:.1f} pages/s), "
+                  f"{chunks} chunks embedded ({chunks / elapsed:.1f} chunks/s) in {elapsed:.1f}s.")
+    pipeline.close()
+
+    # Documents that were removed from DOCS
+    for filename in list(manifest):
+        if filename not in doc_keys:
+            ids = entry_chunk_ids(manifest[filename])
+            print(f"Removing {len(ids)} chunks of deleted document {filename}...")
+            if delete_chunks(ids, namespace=manifest[filename].get('namespace')):
+                del manifest[filename]
+                save_manifest(manifest)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,154 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from rag_engine import embed_texts, upsert_embeddings
+
+# Tunables for large doc sets
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", 25))
+EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", os.cpu_count() or 2))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 64))
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", 4))
+UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", 100))
+MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", 3))
+
+# --- PDF extraction ---
+
+def count_pages(pdf_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(pdf_path).pages)
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> list[tuple[int, str]]:
+    """Extract the text of pages [start, end). Runs in a worker process."""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    return [(page_no, reader.pages[page_no].extract_text()) for page_no in range(start, end)]
+
+def iter_pdf_pages(pdf_path: str, executor: ProcessPoolExecutor, pages_per_task: int = PAGES_PER_TASK):
+    """
+    Yield (page_no, text) for every page, extracting page ranges in parallel.
+    Pages are yielded as their range finishes, not in page order.
+    """
+    total = count_pages(pdf_path)
+    futures = [
+        executor.submit(extract_page_range, pdf_path, start, min(start + pages_per_task, total))
+        for start in range(0, total, pages_per_task)
+    ]
+    for future in as_completed(futures):
+        yield from future.result()
+
+# --- Embedding and upserting ---
+
+def with_retry(fn, *args, retries: int = MAX_RETRIES, base_delay: float = 1.0):
+    """Call fn, retrying with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = base_delay * (2 ** attempt) * (0.5 + random.random())
+            print(f"  {fn.__name__} failed ({e}); retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+class EmbeddingPipeline:
+    """
+    Accepts chunks one at a time, embeds them in batches on a bounded thread pool and upserts
+    the results in batches. add() blocks when EMBED_CONCURRENCY batches are already in flight,
+    so extraction can never run arbitrarily far ahead of the embedding API.
+    """
+
+    def __init__(self, embed_batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY,
+                 upsert_batch_size: int = UPSERT_BATCH_SIZE):
+        self.embed_batch_size = embed_batch_size
+        self.concurrency = concurrency
+        self.upsert_batch_size = upsert_batch_size
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._in_flight = set()
+        self._pending = []  # (text, metadata, id, namespace) waiting for a full embed batch
+        self._embedded = []  # (text, vector, metadata, id, namespace) waiting for a full upsert batch
+        self._lock = threading.Lock()
+        self.errors = []
+        self.chunks = 0
+
+    def add(self, text: str, metadata: dict, chunk_id: str, namespace: str | None = None):
+        self._pending.append((text, metadata, chunk_id, namespace))
+        if len(self._pending) >= self.embed_batch_size:
+            self._submit()
+
+    def _submit(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        while len(self._in_flight) >= self.concurrency:
+            done, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            self._collect(done)
+        self._in_flight.add(self._executor.submit(self._embed_batch, batch))
+
+    def _embed_batch(self, batch):
+        texts = [text for text, _, _, _ in batch]
+        vectors = with_retry(embed_texts, texts)
+        to_upsert = None
+        with self._lock:
+            self._embedded.extend((text, vector, metadata, cid, namespace)
+                                  for (text, metadata, cid, namespace), vector in zip(batch, vectors))
+            if len(self._embedded) >= self.upsert_batch_size:
+                to_upsert, self._embedded = self._embedded, []
+        if to_upsert:
+            self._upsert(to_upsert)
+        return len(batch)
+
+    def _upsert(self, batch):
+        by_namespace = {}
+        for item in batch:
+            by_namespace.setdefault(item[4], []).append(item)
+        for namespace, items in by_namespace.items():
+            with_retry(
+                upsert_embeddings,
+                [text for text, _, _, _, _ in items],
+                [vector for _, vector, _, _, _ in items],
+                [metadata for _, _, metadata, _, _ in items],
+                [cid for _, _, _, cid, _ in items],
+                namespace,
+            )
+
+    def _collect(self, done):
+        for future in done:
+            try:
+                self.chunks += future.result()
+            except Exception as e:
+                self.errors.append(e)
+
+    def flush(self):
+        """
+        Embed and upsert everything still buffered and wait for it.
+        :raises RuntimeError: If any batch failed after retries
+        """
+        self._submit()
+        done = wait(self._in_flight).done
+        self._in_flight = set()
+        self._collect(done)
+        with self._lock:
+            to_upsert, self._embedded = self._embedded, []
+        if to_upsert:
+            try:
+                self._upsert(to_upsert)
+            except Exception as e:
+                self.errors.append(e)
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise RuntimeError(f"{len(errors)} batch(es) failed: {errors[0]}")
+
+    def discard(self):
+        """Drop buffered chunks and wait for in-flight batches, e.g. after a document failed midway."""
+        self._pending = []
+        wait(self._in_flight)
+        self._in_flight = set()
+        with self._lock:
+            self._embedded = []
+        self.errors = []
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,160 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+INTENT_LABELS = ("generate", "explain", "modify", "debug", "other")
+
+DEFAULT_TRAINING_FILE = os.path.join(os.path.dirname(__file__), "data", "intent_examples.jsonl")
+# Labeled examples kept out of training, for checking accuracy and choosing the confidence threshold
+HELDOUT_FILE = os.path.join(os.path.dirname(__file__), "data", "intent_heldout.jsonl")
+# Chosen with choose_threshold() on the held-out set: every prediction at or above it was correct,
+# with some margin over the most confident mistake
+DEFAULT_CONFIDENCE_THRESHOLD = 0.85
+# Candidate softmax temperatures tried by calibrate()
+TEMPERATURES = tuple(1 + 0.5 * i for i in range(39))
+
+_TOKEN_RE = re.compile(r"[a-z0-9_']+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word unigrams plus adjacent-word bigrams."""
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class IntentClassifier:
+    """
+    Multinomial naive Bayes over word n-grams.
+    Small enough to train at import time and classify in microseconds.
+    Naive Bayes treats overlapping n-grams as independent evidence, so raw posteriors are
+    overconfident; fit() calibrates a softmax temperature to temper them.
+    """
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self.temperature = 1.0
+        self.label_counts = Counter()
+        self.token_counts = defaultdict(Counter)
+        self.token_totals = Counter()
+        self.vocab = set()
+
+    def fit(self, examples: list[tuple[str, str]]):
+        """
+        Train on labeled examples.
+        :param examples: List of (text, label) pairs
+        """
+        for text, label in examples:
+            if label not in INTENT_LABELS:
+                raise ValueError(f"Unknown intent label: {label}")
+            tokens = tokenize(text)
+            self.label_counts[label] += 1
+            self.token_counts[label].update(tokens)
+            self.token_totals[label] += len(tokens)
+            self.vocab.update(tokens)
+        self.temperature = self.calibrate(examples)
+        return self
+
+    def _log_scores(self, tokens: list[str], held_out: tuple[str, list[str]] | None = None) -> dict:
+        """
+        Unnormalized log posterior per label.
+        :param held_out: (label, tokens) of a training example to leave out of the counts
+        """
+        total = sum(self.label_counts.values()) - (1 if held_out else 0)
+        vocab_size = len(self.vocab)
+        scores = {}
+        for label, count in self.label_counts.items():
+            counts = self.token_counts[label]
+            token_total = self.token_totals[label]
+            removed = Counter()
+            if held_out and held_out[0] == label:
+                count -= 1
+                removed = Counter(held_out[1])
+                token_total -= len(held_out[1])
+            if count <= 0:
+                continue
+            denom = token_total + self.alpha * vocab_size
+            score = math.log(count / total)
+            for token in tokens:
+                score += math.log((counts[token] - removed[token] + self.alpha) / denom)
+            scores[label] = score
+        return scores
+
+    def _posterior(self, scores: dict, temperature: float) -> dict:
+        best = max(scores.values())
+        weights = {label: math.exp((score - best) / temperature) for label, score in scores.items()}
+        norm = sum(weights.values())
+        return {label: weight / norm for label, weight in weights.items()}
+
+    def calibrate(self, examples: list[tuple[str, str]]) -> float:
+        """
+        Choose the softmax temperature minimizing the leave-one-out log loss on the training
+        examples, so confidences track how often the classifier is actually right.
+        """
+        loo = []
+        for text, label in examples:
+            tokens = tokenize(text)
+            known = [t for t in tokens if t in self.vocab]
+            if known:
+                loo.append((self._log_scores(known, held_out=(label, tokens)), label))
+        if not loo:
+            return 1.0
+
+        def log_loss(temperature):
+            return -sum(math.log(max(self._posterior(scores, temperature).get(label, 0.0), 1e-12))
+                        for scores, label in loo)
+
+        return min(TEMPERATURES, key=log_loss)
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """
+        Classify text.
+        :return: (label, confidence) where confidence is the calibrated posterior probability of the label
+        """
+        tokens = [t for t in tokenize(text) if t in self.vocab]
+        if not tokens or not self.label_counts:
+            return "other", 0.0
+        posterior = self._posterior(self._log_scores(tokens), self.temperature)
+        best = max(posterior, key=posterior.get)
+        return best, posterior[best]
+
+
+def load_examples(path: str = DEFAULT_TRAINING_FILE) -> list[tuple[str, str]]:
+    """Load (text, label) pairs from a JSONL file with 'text' and 'label' fields."""
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                examples.append((item["text"], item["label"]))
+    return examples
+
+
+def choose_threshold(classifier: IntentClassifier, examples: list[tuple[str, str]], min_precision: float = 1.0) -> float:
+    """
+    Lowest confidence threshold at which predictions on the (held-out) examples are at least
+    min_precision correct. Predictions below it would go to the LLM.
+    """
+    predictions = sorted(((*classifier.predict(text), label) for text, label in examples),
+                         key=lambda p: p[1], reverse=True)
+    threshold, correct = 1.0, 0
+    for n, (predicted, confidence, label) in enumerate(predictions, 1):
+        correct += predicted == label
+        if correct / n < min_precision:
+            break
+        threshold = confidence
+    return threshold
+
+
+_classifier = None
+
+
+def get_classifier() -> IntentClassifier:
+    """Return the shared classifier, training it from INTENT_TRAINING_FILE on first use."""
+    global _classifier
+    if _classifier is None:
+        path = os.getenv("INTENT_TRAINING_FILE", DEFAULT_TRAINING_FILE)
+        _classifier = IntentClassifier().fit(load_examples(path))
+    return _classifier
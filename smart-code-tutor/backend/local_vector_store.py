@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+import uuid
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class LocalDocument:
+    """Search hit with the same fields the rest of the code reads from LangChain documents."""
+    page_content: str
+    metadata: dict = field(default_factory=dict)
+
+
+class LocalVectorStore:
+    """
+    In-process vector index exposing the add_texts/similarity_search/delete surface of PineconeVectorStore.
+    Like Pinecone, rows live in namespaces: ids are unique per namespace and searches scan one namespace.
+    Vectors are L2-normalized and persisted to <path>.npy, which is memory-mapped on load;
+    texts, metadata and ids live in <path>.json.
+    Writes with save=False are only buffered: search sees them, and flush() rebuilds the index
+    and writes the files once, so batched ingestion doesn't redo both after every batch.
+    :param embedding: Object with embed_documents/embed_query (e.g. NomicEmbeddings)
+    :param path: File prefix for persistence, or None for a memory-only index
+    :param mode: 'flat' for exact search, 'ivf' for an inverted-file index over k-means clusters
+    :param quantize: Store vectors as int8 instead of float32 (4x smaller, slightly less exact)
+    :param n_lists: Number of IVF clusters
+    :param n_probe: Number of IVF clusters scanned per query
+    """
+
+    def __init__(self, embedding, path: str | None = None, mode: str = "flat", quantize: bool = False,
+                 n_lists: int = 16, n_probe: int = 4):
+        if mode not in ("flat", "ivf"):
+            raise ValueError(f"Unsupported index mode: {mode}")
+        self.embedding = embedding
+        self.path = path
+        self.mode = mode
+        self.quantize = quantize
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self._lock = threading.RLock()
+        self.ids: list[str] = []
+        self.texts: list[str] = []
+        self.metadatas: list[dict] = []
+        self.namespaces: list[str] = []
+        self.vectors = np.zeros((0, 0), dtype=np.int8 if quantize else np.float32)
+        self._centroids = None
+        self._lists = None
+        self._partitions = {}
+        self._keys = set()  # (namespace, id) of every row, to skip scanning for upserts of new ids
+        self._pending = []  # Encoded vectors added since the rows were last stacked into self.vectors
+        self._stale = False  # Partitions/IVF lists don't reflect the current rows yet
+        self.dirty = False  # Rows changed since the last save
+        if path and os.path.exists(path + ".json"):
+            self.load()
+
+    # --- Persistence ---
+
+    def load(self):
+        """
+        (Re)load the index from disk.
+        :raises ValueError: If the files don't match, e.g. while another process is between replacing them
+        """
+        with open(self.path + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(self.path + ".npy", mmap_mode="r")
+        if len(vectors) != len(meta["ids"]):
+            raise ValueError(f"{self.path}: {len(vectors)} vectors for {len(meta['ids'])} ids")
+        with self._lock:
+            self.ids = meta["ids"]
+            self.texts = meta["texts"]
+            self.metadatas = meta["metadatas"]
+            self.namespaces = meta.get("namespaces", [""] * len(self.ids))
+            self.quantize = meta.get("quantize", self.quantize)
+            self.vectors = vectors
+            self._keys = set(zip(self.namespaces, self.ids))
+            self._pending = []
+            self._rebuild()
+            self._stale = False
+            self.dirty = False
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            self._stack_pending()
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Write to temp files first so a crash never leaves a half-written index
+            np.save(self.path + ".tmp.npy", np.ascontiguousarray(self.vectors))
+            with open(self.path + ".tmp.json", "w", encoding="utf-8") as f:
+                json.dump({"ids": self.ids, "texts": self.texts, "metadatas": self.metadatas,
+                           "namespaces": self.namespaces, "quantize": self.quantize}, f)
+            os.replace(self.path + ".tmp.npy", self.path + ".npy")
+            os.replace(self.path + ".tmp.json", self.path + ".json")
+            self.vectors = np.load(self.path + ".npy", mmap_mode="r")
+            self.dirty = False
+
+    def flush(self) -> bool:
+        """
+        Rebuild the index and save it if any buffered write changed it.
+        :return: True if there was anything to flush
+        """
+        with self._lock:
+            if not self.dirty:
+                return False
+            self._ensure_index()
+            self.save()
+            return True
+
+    # --- Vectors ---
+
+    def _encode(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        if self.quantize:
+            return np.round(vectors * 127).astype(np.int8)
+        return vectors
+
+    def _scores(self, query: np.ndarray, rows) -> np.ndarray:
+        scores = self.vectors[rows].astype(np.float32) @ query
+        return scores / 127 if self.quantize else scores
+
+    def _stack_pending(self):
+        if not self._pending:
+            return
+        existing = np.asarray(self.vectors)
+        self.vectors = np.vstack(([existing] if existing.size else []) + self._pending)
+        self._pending = []
+
+    def _ensure_index(self):
+        """Bring the vectors, partitions and IVF lists up to date with buffered writes."""
+        self._stack_pending()
+        if self._stale:
+            self._rebuild()
+            self._stale = False
+
+    def _rebuild(self):
+        """Recompute the per-namespace row lists and the IVF clusters after rows change."""
+        namespaces = np.asarray(self.namespaces, dtype=object)
+        self._partitions = {ns: np.flatnonzero(namespaces == ns) for ns in set(self.namespaces)}
+        self._build_ivf()
+
+    def _build_ivf(self):
+        """Cluster the vectors with a few rounds of k-means and bucket rows by nearest centroid."""
+        self._centroids = None
+        self._lists = None
+        n = len(self.ids)
+        if self.mode != "ivf" or n == 0:
+            return
+        data = np.asarray(self.vectors, dtype=np.float32)
+        k = min(self.n_lists, n)
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(n, size=k, replace=False)].copy()
+        for _ in range(10):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for c in range(k):
+                members = data[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        assign = np.argmax(data @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assign == c) for c in range(k)]
+
+    # --- VectorStore surface ---
+
+    def add_texts(self, texts: list[str], metadatas: list[dict] | None = None, ids: list[str] | None = None,
+                  namespace: str | None = None, save: bool = True, **kwargs):
+        """
+        Embed and add texts. Existing ids are overwritten (upsert).
+        :return: List of ids for the added texts
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas=metadatas, ids=ids,
+                                   namespace=namespace, save=save)
+
+    def add_embeddings(self, texts: list[str], embeddings, metadatas: list[dict] | None = None,
+                       ids: list[str] | None = None, namespace: str | None = None, save: bool = True):
+        """
+        Add texts with precomputed embeddings. Existing ids are overwritten (upsert).
+        :param save: Rebuild and save now; if False, the write is buffered until flush()
+        :return: List of ids for the added texts
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        embeddings = list(embeddings)
+        # Keep only the last occurrence of an id repeated within the batch
+        last = {id_: i for i, id_ in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            texts = [texts[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            ids = [ids[i] for i in keep]
+            embeddings = [embeddings[i] for i in keep]
+        encoded = self._encode(embeddings)
+        namespace = namespace or ""
+        with self._lock:
+            self._delete(set(ids), namespace)
+            self._pending.append(encoded)
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(metadatas)
+            self.namespaces.extend([namespace] * len(ids))
+            self._keys.update((namespace, id_) for id_ in ids)
+            self._stale = self.dirty = True
+            if save:
+                self.flush()
+        return ids
+
+    def _delete(self, ids: set, namespace: str):
+        if not any((namespace, id_) in self._keys for id_ in ids):
+            return
+        self._stack_pending()
+        keep = [i for i, id_ in enumerate(self.ids) if id_ not in ids or self.namespaces[i] != namespace]
+        self.vectors = np.asarray(self.vectors)[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self.namespaces = [self.namespaces[i] for i in keep]
+        self._keys.difference_update((namespace, id_) for id_ in ids)
+        self._stale = self.dirty = True
+
+    def delete(self, ids: list[str] | None = None, namespace: str | None = None, save: bool = True, **kwargs):
+        with self._lock:
+            self._delete(set(ids or []), namespace or "")
+            if save:
+                self.flush()
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict | None = None,
+                                               namespace: str | None = None) -> list[tuple[LocalDocument, float]]:
+        """
+        Search one namespace (the default one if None) and return (document, cosine similarity) pairs.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        with self._lock:
+            self._ensure_index()
+            rows = self._partitions.get(namespace or "")
+            if rows is None or len(rows) == 0:
+                return []
+            if self._centroids is not None:
+                probe = np.argsort(-(self._centroids @ query))[:self.n_probe]
+                rows = np.intersect1d(rows, np.concatenate([self._lists[c] for c in probe]))
+            if filter:
+                rows = np.asarray([i for i in rows
+                                   if all(self.metadatas[i].get(key) == value for key, value in filter.items())],
+                                  dtype=np.int64)
+            if len(rows) == 0:
+                return []
+            scores = self._scores(query, rows)
+            top = np.argsort(-scores)[:k]
+            return [(LocalDocument(self.texts[rows[i]], dict(self.metadatas[rows[i]])), float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict | None = None,
+                                    namespace: str | None = None) -> list[LocalDocument]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter, namespace)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, namespace: str | None = None,
+                          **kwargs) -> list[LocalDocument]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k=k, filter=filter,
+                                                namespace=namespace)
@@ -1,13 +1,22 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import json
 from dotenv import load_dotenv
 import os
-from e2b_code_interpreter import Sandbox
-from rag_engine import retrieve_relevant_docs, generate_explanation
-from langchain_groq import ChatGroq
-from pydantic.types import SecretStr
+from sandbox_pool import create_sandbox_pool_from_env, SUPPORTED_LANGUAGES
+import rag_engine
+from rag_engine import retrieve_relevant_docs, generate_explanation, cache_stats
+from intent_classifier import DEFAULT_CONFIDENCE_THRESHOLD, get_classifier
+from execution_cache import get_cached_result, store_result, execution_cache
+from prompt_budget import PromptBudget
+from llm_client import get_llm_client
+from metrics import Trace, current_trace, span, track_request, requests_total, render_prometheus
 import asyncio
+import threading
+import time
+import uuid
+from contextlib import aclosing
 
 load_dotenv()
 
@@ -22,65 +31,167 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def execute_code(code, language):
+# Pre-warmed sandboxes shared by all connections
+sandbox_pool = create_sandbox_pool_from_env()
+
+@app.on_event("startup")
+def start_sandbox_pool():
+    threading.Thread(target=sandbox_pool.warm_up, daemon=True).start()
+    sandbox_pool.start_maintenance()
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Connect to the embedding API and vector store in the background so startup is not blocked
+    app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+
+def warm_up():
+    get_classifier()
+    rag_engine.warm_up()
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once every dependency is initialized, 503 until then."""
+    status = rag_engine.readiness()
+    status["dependencies"]["sandbox_pool"] = {"state": "ready", "pools": sandbox_pool.stats()}
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.on_event("shutdown")
+def stop_sandbox_pool():
+    sandbox_pool.close()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {**cache_stats(), "execution": execution_cache.stats()}
+
+@app.get("/metrics")
+def get_metrics():
+    """Stage latency histograms, request counts, in-flight requests and sandbox counts in Prometheus text format."""
+    return PlainTextResponse(render_prometheus(sandbox_pool.stats()), media_type="text/plain; version=0.0.4")
+
+def _join_log(value) -> str:
+    # E2B and the local backend return each stream as a list of chunks
+    return ''.join(value) if isinstance(value, list) else str(value or '')
+
+def parse_execution_logs(execution):
+    """Flatten an execution result into (output, error) strings."""
     output = ""
     error = ""
+    if hasattr(execution, 'logs'):
+        logs = execution.logs
+        if isinstance(logs, dict):
+            output = _join_log(logs.get('stdout', ''))
+            error = _join_log(logs.get('stderr', ''))
+        elif hasattr(logs, 'stdout') or hasattr(logs, 'stderr'):
+            output = _join_log(getattr(logs, 'stdout', ''))
+            error = _join_log(getattr(logs, 'stderr', ''))
+        elif isinstance(logs, str):
+            output = logs
+    return output, error
+
+async def execute_code_async(code, language):
+    """
+    Run code in a pooled sandbox, backed by the execution cache.
+    Cancelling the caller aborts the sandbox run.
+    :return: (output, error, cached)
+    """
+    if language not in SUPPORTED_LANGUAGES:
+        return "", f"Unsupported language: {language}", False
+    cached = get_cached_result(code, language)
+    if cached is not None:
+        return cached[0], cached[1], True
     try:
-        if language == "python":
-            sbx = Sandbox(api_key=os.getenv("E2B_API_KEY"))
-            execution = sbx.run_code(code)
-        elif language == "javascript":
-            sbx = Sandbox(api_key=os.getenv("E2B_API_KEY"))
-            execution = sbx.run_code(code, language="js")
-        elif language == "typescript":
-            sbx = Sandbox(api_key=os.getenv("E2B_API_KEY"))
-            execution = sbx.run_code(code, language="ts")
-        else:
-            return "", f"Unsupported language: {language}"
-        if hasattr(execution, 'logs'):
-            logs = execution.logs
-            if isinstance(logs, dict):
-                output = ''.join(logs.get('stdout', [])) if isinstance(logs.get('stdout', []), list) else str(logs.get('stdout', ''))
-                error = ''.join(logs.get('stderr', [])) if isinstance(logs.get('stderr', []), list) else str(logs.get('stderr', ''))
-            elif hasattr(logs, 'stdout') or hasattr(logs, 'stderr'):
-                output = getattr(logs, 'stdout', '')
-                error = getattr(logs, 'stderr', '')
-            elif isinstance(logs, str):
-                output = logs
+        with span("sandbox_run"):
+            execution = await sandbox_pool.run_async(code, language)
+        output, error = parse_execution_logs(execution)
     except Exception as e:
-        error = str(e)
-    return output, error
+        # Sandbox failures say nothing about the code, so they are not cached
+        return "", str(e), False
+    store_result(code, language, (output, error))
+    return output, error, False
+
+# Limits for streamed runs: the sandbox is killed once either is exceeded
+RUN_TIME_LIMIT = float(os.getenv("RUN_TIME_LIMIT", 30))
+RUN_MAX_OUTPUT_BYTES = int(os.getenv("RUN_MAX_OUTPUT_BYTES", 1024 * 1024))
 
-# Async wrappers for blocking functions
-def sync_execute_code(*args, **kwargs):
-    return execute_code(*args, **kwargs)
+async def stream_execution(sender, request_id: str, code: str, language: str) -> dict:
+    """
+    Run code and forward its stdout/stderr to the client as they are produced, as
+    {"type": "stdout" | "stderr", "request_id", "data"} frames.
+    :return: The run summary, sent by the caller as the final "exit" frame
+    """
+    if language not in SUPPORTED_LANGUAGES:
+        return {"status": "error", "error": f"Unsupported language: {language}"}
+    cached = get_cached_result(code, language)
+    if cached is not None:
+        started = time.monotonic()
+        sent = {}
+        for stream, data in zip(("stdout", "stderr"), cached):
+            if data:
+                await sender.send_text(json.dumps({"type": stream, "request_id": request_id, "data": data}))
+            sent[f"{stream}_bytes"] = len(data.encode("utf-8"))
+        # Same summary fields as a live run
+        return {"status": "completed", "duration": round(time.monotonic() - started, 3), **sent, "cached": True}
+    collected = {"stdout": [], "stderr": []}
 
-def sync_detect_intent(*args, **kwargs):
-    return detect_intent(*args, **kwargs)
+    async def on_output(stream: str, data: str):
+        collected[stream].append(data)
+        await sender.send_text(json.dumps({"type": stream, "request_id": request_id, "data": data}))
 
-def sync_route_llm_response(*args, **kwargs):
-    return route_llm_response(*args, **kwargs)
+    try:
+        with span("sandbox_run"):
+            summary = await sandbox_pool.run_streaming_async(code, language, on_output, RUN_TIME_LIMIT,
+                                                             RUN_MAX_OUTPUT_BYTES)
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+    # Only complete runs are cached; killed or failed runs say nothing about the code's real output
+    if summary["status"] == "completed":
+        store_result(code, language, (''.join(collected["stdout"]), ''.join(collected["stderr"])))
+    return {**summary, "cached": False}
 
 # --- Intent Detection and Routing ---
 
-def detect_intent(user_message: str, groq_api_key: str) -> str:
+def make_llm(groq_api_key: str):
+    # Shared across requests so connections are reused and concurrency/rate limits apply process-wide
+    return get_llm_client(groq_api_key)
+
+# Local classifier answers first; the LLM is only asked when it is unsure
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", DEFAULT_CONFIDENCE_THRESHOLD))
+
+async def detect_intent(user_message: str, groq_api_key: str) -> str:
+    """Classify the user message intent locally, falling back to the LLM below the confidence threshold."""
+    with span("intent_classifier"):
+        label, confidence = get_classifier().predict(user_message)
+    if confidence >= INTENT_CONFIDENCE_THRESHOLD:
+        return label
+    return await detect_intent_llm(user_message, groq_api_key)
+
+async def detect_intent_llm(user_message: str, groq_api_key: str) -> str:
     """Use LLM to classify the user message intent."""
-    llm = ChatGroq(api_key=SecretStr(groq_api_key), model="meta-llama/llama-4-scout-17b-16e-instruct")
+    llm = make_llm(groq_api_key)
     prompt = f"""
 Classify the following user message as one of: 'generate', 'explain', 'modify', 'debug', or 'other'.
 Respond with only the label.
 Message: {user_message}
 """
-    result = llm.invoke(prompt)
+    with span("intent_llm"):
+        result = await llm.ainvoke(prompt)
     label = str(getattr(result, 'content', result)).strip().lower()
     return label
 
-def route_llm_response(intent: str, code: str, output: str, error: str, user_message: str, groq_api_key: str):
-    # Retrieve relevant docs for all intents
-    query = user_message or error or code
-    retrieved_docs = retrieve_relevant_docs(query, top_k=3)
-    docs_text = '\n'.join(retrieved_docs) if retrieved_docs else ''
-    llm = ChatGroq(api_key=SecretStr(groq_api_key), model="meta-llama/llama-4-scout-17b-16e-instruct")
+def build_llm_prompt(intent: str, code: str, output: str, error: str, user_message: str, retrieved_docs: list[str]):
+    """
+    Build the prompt for the intent, trimming each section to its token budget.
+    :return: (prompt, token usage report)
+    """
+    budget = PromptBudget()
+    # Only the sections the intent's template uses are trimmed and counted
+    user_message = budget.text('user_message', user_message) if intent != 'explain' else user_message
+    if intent in ('explain', 'modify', 'debug'):
+        code = budget.text('code', code)
+    if intent == 'debug':
+        error = budget.text('error', error)
+        output = budget.text('output', output)
+    docs_text = budget.docs(retrieved_docs)
     if intent == 'generate':
         prompt = f"""
 You are a helpful coding assistant. Write code as per the following request:
@@ -127,39 +238,267 @@ You are a helpful coding assistant. Answer the following user question:
 Relevant Documentation:
 {docs_text}
 """
-    result = llm.invoke(prompt)
+    return prompt, budget.report(prompt)
+
+# --- Explain pipeline ---
+
+# Per-stage time limits (seconds). A stage that overruns is skipped and reported as degraded.
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", 2.0))
+INTENT_TIMEOUT = float(os.getenv("INTENT_TIMEOUT", 5.0))
+
+async def prepare_explain(code: str, language: str, output: str, error: str, user_message: str, groq_api_key: str):
+    """
+    Run retrieval and intent detection concurrently, then assemble the prompt.
+    Retrieval only depends on the query, so it no longer waits for the intent.
+    :return: (intent, prompt, degraded, tokens) where degraded lists the stages that timed out or failed
+        and tokens is the prompt's token usage report
+    """
+    # Retrieve relevant docs for all intents
+    query = user_message or error or code
+    retrieval = asyncio.create_task(
+        asyncio.wait_for(asyncio.to_thread(retrieve_relevant_docs, query, 3, language), RETRIEVAL_TIMEOUT)
+    )
+    degraded = []
+    try:
+        try:
+            intent = await asyncio.wait_for(detect_intent(user_message, groq_api_key), INTENT_TIMEOUT)
+        except asyncio.TimeoutError:
+            intent = 'other'
+            degraded.append("intent")
+        except Exception as e:
+            print(f"Error detecting intent: {e}")
+            intent = 'other'
+            degraded.append("intent")
+        try:
+            retrieved_docs = await retrieval
+        except asyncio.TimeoutError:
+            retrieved_docs = []
+            degraded.append("retrieval")
+        except Exception as e:
+            print(f"Error retrieving docs: {e}")
+            retrieved_docs = []
+            degraded.append("retrieval")
+    finally:
+        retrieval.cancel()
+    with span("prompt_build"):
+        prompt, tokens = build_llm_prompt(intent, code, output, error, user_message, retrieved_docs)
+    return intent, prompt, degraded, tokens
+
+async def route_llm_response(prompt: str, groq_api_key: str):
+    llm = make_llm(groq_api_key)
+    with span("llm"):
+        result = await llm.ainvoke(prompt)
     return str(getattr(result, 'content', result))
 
+async def stream_llm_response(prompt: str, groq_api_key: str):
+    """Async generator yielding the LLM response token by token."""
+    llm = make_llm(groq_api_key)
+    # aclosing: closing this generator early must also end the client's stream and release its slot
+    async with aclosing(llm.astream(prompt)) as stream:
+        async for chunk in stream:
+            text = str(getattr(chunk, 'content', chunk))
+            if text:
+                yield text
+
+# --- Streaming ---
+
+# Max number of token chunks buffered per stream before the LLM read is paused
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", 64))
+
+async def send_stream(websocket, request_id: str, chunks, trace: Trace | None = None, **start_fields) -> str:
+    """
+    Forward token chunks to the client as start/delta/end frames tagged with request_id.
+    Tokens are read into a bounded buffer: when the client reads slowly the buffer fills,
+    the producer stops pulling from the LLM, and buffered tokens are coalesced into one delta.
+    :param trace: If given, its stage timings are added to the end frame
+    :return: The full streamed text
+    """
+    queue = asyncio.Queue(maxsize=STREAM_BUFFER_SIZE)
+    done = object()
+
+    async def produce():
+        # No finally: once cancelled nobody reads the queue, so putting the sentinel could block forever
+        try:
+            async for token in chunks:
+                await queue.put(token)
+        except Exception:
+            await queue.put(done)
+            raise
+        await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    parts = []
+    try:
+        await websocket.send_text(json.dumps({"type": "start", "request_id": request_id, **start_fields}))
+        finished = False
+        while not finished:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            if batch[-1] is done:
+                batch.pop()
+                finished = True
+            if batch:
+                delta = ''.join(batch)
+                parts.append(delta)
+                await websocket.send_text(json.dumps({"type": "delta", "request_id": request_id, "delta": delta}))
+        end_frame = {"type": "end", "request_id": request_id, "explanation": ''.join(parts)}
+        try:
+            await producer
+        except Exception as e:
+            end_frame["error"] = str(e)
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        # Closing the generator ends the LLM call and frees its concurrency slot
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    if trace is not None:
+        end_frame["timings"] = trace.timings()
+    await websocket.send_text(json.dumps(end_frame))
+    return end_frame["explanation"]
+
+# --- WebSocket protocol ---
+
+# Max number of requests a single connection may have running at once
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", 4))
+
+class SerializedSender:
+    """Serializes send_text calls so concurrent request tasks never interleave frames."""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self._lock = asyncio.Lock()
+
+    async def send_text(self, text: str):
+        async with self._lock:
+            await self.websocket.send_text(text)
+
+async def handle_request(sender: SerializedSender, payload: dict, request_id: str):
+    """
+    Run a single run/explain request and send its response tagged with request_id.
+    Each stage is timed into the /metrics histograms; with "timings": true in the payload
+    the final frame also carries the per-stage timings in milliseconds.
+    """
+    action = payload.get("action", "run")  # default to 'run' for backward compatibility
+    kind = action if action in ("run", "explain") else "unknown"
+    # Each request runs in its own task, so this only sets the trace for this request
+    trace = Trace()
+    current_trace.set(trace)
+    timings = trace if payload.get("timings") else None
+    try:
+        with track_request(), span(f"request_{kind}"):
+            response_obj, ok = await process_request(sender, payload, request_id, timings)
+    except asyncio.CancelledError:
+        requests_total.inc(kind, "cancelled")
+        try:
+            await sender.send_text(json.dumps({"request_id": request_id, "status": "cancelled"}))
+        except Exception:
+            pass  # Connection already closed
+        raise
+    requests_total.inc(kind, "ok" if ok else "error")
+    if response_obj is None:
+        return  # Streamed responses send their own final frame
+    response_obj["request_id"] = request_id
+    with span("serialize"):
+        text = json.dumps(response_obj)
+    if timings is not None:
+        response_obj["timings"] = trace.timings()
+        text = json.dumps(response_obj)
+    await sender.send_text(text)
+
+async def process_request(sender: SerializedSender, payload: dict, request_id: str, timings: Trace | None):
+    """
+    Do the work for one request.
+    :return: (response, ok) where response is None if it was already streamed to the client
+    """
+    try:
+        action = payload.get("action", "run")
+        code = payload.get("code", "")
+        language = payload.get("language", "")
+        groq_api_key = os.getenv("GROQ_API_KEY")
+        if not groq_api_key:
+            return {"error": "GROQ_API_KEY is not set in the backend environment."}, False
+        elif action == "run" and payload.get("stream"):
+            summary = await stream_execution(sender, request_id, code, language)
+            frame = {"type": "exit", "request_id": request_id, **summary}
+            if timings is not None:
+                frame["timings"] = timings.timings()
+            await sender.send_text(json.dumps(frame))
+            return None, summary["status"] != "error"
+        elif action == "run":
+            output, error, cached = await execute_code_async(code, language)
+            return {"output": output, "error": error, "cached": cached}, True
+        elif action == "explain":
+            output = payload.get("output", "")
+            error = payload.get("error", "")
+            user_message = payload.get("user_message", "")
+            # 1. Detect intent and retrieve docs concurrently
+            intent, prompt, degraded, prompt_tokens = await prepare_explain(
+                code, language, output, error, user_message, groq_api_key)
+            if payload.get("stream"):
+                chunks = stream_llm_response(prompt, groq_api_key)
+                with span("llm_stream"):
+                    await send_stream(sender, request_id, chunks, trace=timings, intent=intent, degraded=degraded,
+                                      tokens=prompt_tokens)
+                return None, True
+            # 2. Route to correct LLM prompt
+            explanation = await route_llm_response(prompt, groq_api_key)
+            return {"explanation": explanation, "intent": intent, "degraded": degraded, "tokens": prompt_tokens}, True
+        else:
+            return {"error": f"Unknown action: {action}"}, False
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return {"output": "", "error": str(e)}, False
+
+def on_request_done(in_flight: dict, request_id: str, task: asyncio.Task):
+    if in_flight.get(request_id) is task:
+        del in_flight[request_id]
+    if not task.cancelled() and task.exception():
+        print(f"Error handling request {request_id}: {task.exception()}")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    while True:
-        data = await websocket.receive_text()
-        try:
-            payload = json.loads(data)
-            action = payload.get("action", "run")  # default to 'run' for backward compatibility
-            code = payload.get("code", "")
-            language = payload.get("language", "")
-            groq_api_key = os.getenv("GROQ_API_KEY")
-            if not groq_api_key:
-                response = json.dumps({"error": "GROQ_API_KEY is not set in the backend environment."})
-                await websocket.send_text(response)
+    sender = SerializedSender(websocket)
+    in_flight = {}  # request_id -> asyncio.Task
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                payload = json.loads(data)
+            except Exception as e:
+                await sender.send_text(json.dumps({"output": "", "error": str(e)}))
                 continue
-            if action == "run":
-                output, error = await asyncio.to_thread(sync_execute_code, code, language)
-                response_obj = {"output": output, "error": error}
-            elif action == "explain":
-                output = payload.get("output", "")
-                error = payload.get("error", "")
-                user_message = payload.get("user_message", "")
-                # 1. Detect intent
-                intent = await asyncio.to_thread(sync_detect_intent, user_message, groq_api_key)
-                # 2. Route to correct LLM prompt
-                explanation = await asyncio.to_thread(sync_route_llm_response, intent, code, output, error, user_message, groq_api_key)
-                response_obj = {"explanation": explanation, "intent": intent}
-            else:
-                response_obj = {"error": f"Unknown action: {action}"}
-            response = json.dumps(response_obj)
-        except Exception as e:
-            response = json.dumps({"output": "", "error": str(e)})
-        await websocket.send_text(response)
\ No newline at end of file
+            request_id = str(payload.get("request_id") or uuid.uuid4().hex)
+            if payload.get("action") == "cancel":
+                task = in_flight.get(request_id)
+                if task:
+                    task.cancel()
+                else:
+                    await sender.send_text(json.dumps({"request_id": request_id, "status": "not_found"}))
+                continue
+            if request_id in in_flight:
+                # Replacing the running task would make it uncancellable and mix two responses under one id
+                await sender.send_text(json.dumps({
+                    "request_id": request_id,
+                    "error": f"Request {request_id} is already in flight.",
+                }))
+                continue
+            if len(in_flight) >= WS_MAX_IN_FLIGHT:
+                await sender.send_text(json.dumps({
+                    "request_id": request_id,
+                    "error": f"Too many requests in flight (limit {WS_MAX_IN_FLIGHT}).",
+                }))
+                continue
+            task = asyncio.create_task(handle_request(sender, payload, request_id))
+            in_flight[request_id] = task
+            task.add_done_callback(lambda t, rid=request_id: on_request_done(in_flight, rid, t))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Abort any work still running for this connection
+        for task in list(in_flight.values()):
+            task.cancel()
@@ -0,0 +1,142 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Thread-safe latency histogram with one series per label value, in the Prometheus style."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.setdefault(label_value, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_value, values in sorted(series.items()):
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += values[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Thread-safe counter keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+stage_duration = Histogram("tutor_stage_duration_seconds", "Time spent in each request stage.", "stage")
+requests_total = Counter("tutor_requests_total", "Requests handled over /ws.", ("action", "status"))
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+class Trace:
+    """Collects the spans of one request. Repeated stages (e.g. one search per namespace) are summed."""
+
+    def __init__(self):
+        self.spans = []  # (stage, seconds)
+
+    def timings(self) -> dict:
+        """Milliseconds per stage, in the order stages first ran."""
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return {stage: round(seconds * 1000, 2) for stage, seconds in totals.items()}
+
+
+# The trace of the request being handled. asyncio tasks and asyncio.to_thread copy the
+# context, so spans recorded in worker threads (e.g. in rag_engine) land in the right trace.
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block into the stage histogram and the current request's trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(stage, elapsed)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, elapsed))
+
+
+@contextmanager
+def track_request():
+    """Count the enclosed block as an in-flight request."""
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    try:
+        yield
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+
+def render_prometheus(sandbox_stats: dict | None = None) -> str:
+    """
+    Render all metrics in the Prometheus text exposition format.
+    :param sandbox_stats: SandboxPool.stats() output, exported as idle/in-use gauges per language
+    """
+    lines = stage_duration.render() + requests_total.render()
+    lines += [
+        "# HELP tutor_requests_in_flight Requests currently being handled.",
+        "# TYPE tutor_requests_in_flight gauge",
+        f"tutor_requests_in_flight {_in_flight}",
+    ]
+    if sandbox_stats is not None:
+        lines += ["# HELP tutor_sandboxes Sandboxes in the pool by language and state.",
+                  "# TYPE tutor_sandboxes gauge"]
+        for language, counts in sorted(sandbox_stats.items()):
+            for state, count in sorted(counts.items()):
+                lines.append(f'tutor_sandboxes{{language="{language}",state="{state}"}} {count}')
+    return "\n".join(lines) + "\n"
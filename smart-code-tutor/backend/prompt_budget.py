@@ -0,0 +1,197 @@
+import math
+import os
+import re
+
+# Token budgets per prompt section, and for the whole prompt
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", 6000))
+SECTION_BUDGETS = {
+    "user_message": int(os.getenv("PROMPT_BUDGET_USER_MESSAGE", 500)),
+    "code": int(os.getenv("PROMPT_BUDGET_CODE", 2000)),
+    "error": int(os.getenv("PROMPT_BUDGET_ERROR", 800)),
+    "output": int(os.getenv("PROMPT_BUDGET_OUTPUT", 800)),
+    "docs": int(os.getenv("PROMPT_BUDGET_DOCS", 1500)),
+}
+# Retrieved chunks sharing at least this fraction of their word shingles count as duplicates
+DOC_OVERLAP_THRESHOLD = float(os.getenv("PROMPT_DOC_OVERLAP_THRESHOLD", 0.6))
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_PY_FRAME_RE = re.compile(r'^\s*File "[^"]*", line \d+')
+_JS_FRAME_RE = re.compile(r"^\s*at\s")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in text without loading a tokenizer.
+    Every punctuation mark counts as one token and every word as one token per 4 characters,
+    which tracks BPE tokenizers closely enough for budgeting code and logs.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECE_RE.findall(text or ""))
+
+
+def _fit_line(line: str, budget: int) -> str:
+    """Cut a single line to roughly budget tokens."""
+    if count_tokens(line) <= budget:
+        return line
+    return line[:max(budget, 1) * 4] + " ..."
+
+
+def trim_head_tail(text: str, budget: int) -> str:
+    """
+    Fit text into budget tokens by keeping its first and last lines and replacing the middle
+    with an omission marker. The tail gets the larger share, since that is where programs
+    usually print their final state or fail.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    lines = text.splitlines()
+    head_budget = budget // 3
+    tail_budget = budget - head_budget
+    head = []
+    used = 0
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if used + cost > head_budget:
+            break
+        head.append(line)
+        used += cost
+    tail = []
+    used = 0
+    for line in reversed(lines[len(head):]):
+        cost = count_tokens(line) + 1
+        if used + cost > tail_budget:
+            break
+        tail.append(line)
+        used += cost
+    tail.reverse()
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # A single huge line: keep its end
+        return "... " + text[-max(budget, 1) * 4:]
+    return "\n".join(head + [f"... [{omitted} lines omitted] ..."] + tail)
+
+
+def innermost_frame(lines: list[str]) -> list[str]:
+    """
+    Return the lines of the innermost stack frame: the last `File "...", line N` entry and its
+    source line for Python tracebacks, or the first `at ...` line for JavaScript stacks.
+    """
+    for i in range(len(lines) - 1, -1, -1):
+        if _PY_FRAME_RE.match(lines[i]):
+            frame = [lines[i]]
+            if i + 1 < len(lines) and lines[i + 1].startswith("    ") and not _PY_FRAME_RE.match(lines[i + 1]):
+                frame.append(lines[i + 1])
+            return frame
+    for line in lines:
+        if _JS_FRAME_RE.match(line):
+            return [line]
+    return []
+
+
+def trim_traceback(text: str, budget: int) -> str:
+    """
+    Fit an error/traceback into budget tokens. The innermost frame and the final exception
+    message are always kept, the rest of the budget goes to head/tail of the full text.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    trimmed = trim_head_tail(text, budget)
+    lines = text.splitlines()
+    essential = innermost_frame(lines)
+    # Python prints the exception message last, JavaScript right above the stack
+    if essential and _JS_FRAME_RE.match(essential[0]):
+        above = lines[:lines.index(essential[0])]
+    else:
+        above = lines
+    message = next((line for line in reversed(above) if line.strip()), "")
+    if message not in essential:
+        essential.append(message)
+    if all(line in trimmed.splitlines() for line in essential):
+        return trimmed
+    kept = "\n".join(["... innermost frame:"] + [_fit_line(line, budget // 4) for line in essential])
+    remaining = budget - count_tokens(kept) - 1
+    if remaining <= 0:
+        return kept
+    return trim_head_tail("\n".join(lines[:-1]), remaining) + "\n" + kept
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = text.split()
+    return {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def dedupe_docs(docs: list[str], threshold: float = DOC_OVERLAP_THRESHOLD) -> list[str]:
+    """
+    Drop retrieved chunks that repeat an earlier (higher ranked) chunk: exact duplicates,
+    chunks contained in another, and chunks whose word shingles mostly overlap one already kept.
+    """
+    kept = []
+    kept_shingles = []
+    for doc in docs:
+        text = doc.strip()
+        if not text or any(text in other for other in kept):
+            continue
+        # A longer chunk that contains earlier ones replaces them, at the rank of the first.
+        # Checked before the shingle overlap, which a contained chunk always exceeds.
+        contained = [i for i, other in enumerate(kept) if other in text]
+        shingles = _shingles(text)
+        if any(len(shingles & other) / min(len(shingles), len(other)) >= threshold
+               for i, other in enumerate(kept_shingles) if i not in contained):
+            continue
+        position = contained[0] if contained else len(kept)
+        for i in reversed(contained):
+            del kept[i], kept_shingles[i]
+        kept.insert(position, text)
+        kept_shingles.insert(position, shingles)
+    return kept
+
+
+def fit_docs(docs: list[str], budget: int) -> list[str]:
+    """Keep whole chunks in rank order while they fit; the first one that doesn't is truncated."""
+    fitted = []
+    used = 0
+    for doc in docs:
+        cost = count_tokens(doc) + 1
+        if used + cost <= budget:
+            fitted.append(doc)
+            used += cost
+            continue
+        if budget - used > 32:
+            fitted.append(trim_head_tail(doc, budget - used))
+        break
+    return fitted
+
+
+class PromptBudget:
+    """
+    Trims the sections of a prompt to their token budgets and records what was used.
+    :param max_tokens: Budget for the whole prompt; docs get whatever the other sections leave
+    :param budgets: Per-section budgets, defaulting to SECTION_BUDGETS
+    """
+
+    def __init__(self, max_tokens: int = PROMPT_MAX_TOKENS, budgets: dict | None = None):
+        self.max_tokens = max_tokens
+        self.budgets = {**SECTION_BUDGETS, **(budgets or {})}
+        self.usage = {}
+        self.trimmed = []
+
+    def _record(self, name: str, original: str, fitted: str) -> str:
+        self.usage[name] = count_tokens(fitted)
+        if fitted != original:
+            self.trimmed.append(name)
+        return fitted
+
+    def text(self, name: str, value: str) -> str:
+        value = value or ""
+        trim = trim_traceback if name == "error" else trim_head_tail
+        return self._record(name, value, trim(value, self.budgets[name]))
+
+    def docs(self, docs: list[str]) -> str:
+        unique = dedupe_docs(docs or [])
+        remaining = self.max_tokens - sum(self.usage.values())
+        fitted = fit_docs(unique, max(min(self.budgets["docs"], remaining), 0))
+        original = [doc.strip() for doc in docs or [] if doc.strip()]
+        return self._record("docs", "\n".join(original), "\n".join(fitted))
+
+    def report(self, prompt: str) -> dict:
+        """Token counts for the finished prompt, to be returned to the client and logged."""
+        return {"prompt": count_tokens(prompt), "sections": dict(self.usage), "trimmed": list(self.trimmed)}
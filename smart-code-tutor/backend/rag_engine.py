@@ -1,12 +1,15 @@
-from pinecone import Pinecone, ServerlessSpec
-from langchain_pinecone import PineconeVectorStore
-from langchain_nomic import NomicEmbeddings
-from langchain_groq import ChatGroq
-from langchain.text_splitter import Language, RecursiveCharacterTextSplitter
-from langchain.schema import Document
+# Heavy client libraries (langchain, pinecone, nomic, numpy) are imported on first use,
+# so importing this module is cheap and does no network I/O.
 import os
-from pydantic.types import SecretStr
+import hashlib
+import threading
+import time
 from dotenv import load_dotenv
+from cache import TTLCache
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from metrics import span
+from llm_client import get_llm_client
+import re
 
 load_dotenv()
 # Load environment variables for API keys
@@ -14,79 +17,388 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 NOMIC_API_KEY = os.getenv("NOMIC_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-# 1. Initialize Nomic Embeddings
-embeddings = NomicEmbeddings(nomic_api_key=NOMIC_API_KEY, model="nomic-embed-text-v1.5")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", os.path.join(os.path.dirname(__file__), "data", "local_index"))
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "flat")  # 'flat' or 'ivf'
+LOCAL_INDEX_QUANTIZE = os.getenv("LOCAL_INDEX_QUANTIZE", "false").lower() == "true"
+# Fuse BM25 keyword hits with vector hits, so exact identifiers like `enumerate` or `TypeError` rank well
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(os.path.dirname(__file__), "data", "bm25_index.json"))
+RRF_K = int(os.getenv("RRF_K", 60))
+# Each retriever contributes top_k * HYBRID_CANDIDATES candidates to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 4))
+# Seconds to wait before retrying a dependency that failed to initialize
+INIT_RETRY_INTERVAL = float(os.getenv("INIT_RETRY_INTERVAL", 30))
 
-# 2. Initialize Pinecone with error handling
 index_name = "code-docs-index"
-vector_store = None
-index = None
 
-try:
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    # Check if index exists and has correct dimension
-    if not pc.has_index(index_name):
-        try:
-            created_index = pc.create_index(
-                name=index_name,
-                dimension=768,
-                spec=ServerlessSpec(cloud="aws", region="us-east-1")  # Adjust as needed
-            )
-        except Exception as e:
-            print(f"Error creating Pinecone index: {e}")
-    index = pc.Index(name=index_name)
-    vector_store = PineconeVectorStore(embedding=embeddings, index=index)
-except Exception as e:
-    print(f"Error connecting to Pinecone: {e}")
+_init_lock = threading.Lock()
+_embeddings = None
+_vector_store = None
+_index = None
+_splitters = {}
+_keyword_index = None
+# Dependency name -> {"state": "pending" | "ready" | "error", "error": ..., "since": ...}
+_status = {
+    "embeddings": {"state": "pending"},
+    "vector_store": {"state": "pending"},
+}
+
+def _retry_allowed(name: str) -> bool:
+    status = _status[name]
+    return status["state"] != "error" or time.monotonic() - status["since"] >= INIT_RETRY_INTERVAL
+
+def _mark(name: str, state: str, error: Exception | None = None):
+    _status[name] = {"state": state, "since": time.monotonic()}
+    if error is not None:
+        _status[name]["error"] = str(error)
+
+# 1. Initialize Nomic Embeddings
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None and _retry_allowed("embeddings"):
+        with _init_lock:
+            if _embeddings is None:
+                try:
+                    from langchain_nomic import NomicEmbeddings
+                    _embeddings = NomicEmbeddings(nomic_api_key=NOMIC_API_KEY, model="nomic-embed-text-v1.5")
+                    _mark("embeddings", "ready")
+                except Exception as e:
+                    print(f"Error initializing Nomic embeddings: {e}")
+                    _mark("embeddings", "error", e)
+    return _embeddings
+
+# 2. Initialize the vector store: remote Pinecone or an in-process local index
+
+def get_vector_store():
+    """Return the vector store, connecting on first use. Returns None if it is unavailable."""
+    global _vector_store, _index
+    if _vector_store is None and _retry_allowed("vector_store"):
+        embeddings = get_embeddings()
+        if embeddings is None:
+            return None
+        with _init_lock:
+            if _vector_store is None:
+                try:
+                    if VECTOR_BACKEND == "local":
+                        from local_vector_store import LocalVectorStore
+                        _vector_store = LocalVectorStore(embeddings, LOCAL_INDEX_PATH, mode=LOCAL_INDEX_MODE,
+                                                         quantize=LOCAL_INDEX_QUANTIZE)
+                    else:
+                        from pinecone import Pinecone, ServerlessSpec
+                        from langchain_pinecone import PineconeVectorStore
+                        pc = Pinecone(api_key=PINECONE_API_KEY)
+                        # Check if index exists and has correct dimension
+                        if not pc.has_index(index_name):
+                            try:
+                                pc.create_index(
+                                    name=index_name,
+                                    dimension=768,
+                                    spec=ServerlessSpec(cloud="aws", region="us-east-1")  # Adjust as needed
+                                )
+                            except Exception as e:
+                                print(f"Error creating Pinecone index: {e}")
+                        _index = pc.Index(name=index_name)
+                        _vector_store = PineconeVectorStore(embedding=embeddings, index=_index)
+                    _mark("vector_store", "ready")
+                except Exception as e:
+                    print(f"Error connecting to Pinecone: {e}")
+                    _mark("vector_store", "error", e)
+    return _vector_store
+
+def get_keyword_index() -> BM25Index:
+    """Return the BM25 index, loading it from disk on first use."""
+    global _keyword_index
+    if _keyword_index is None:
+        with _init_lock:
+            if _keyword_index is None:
+                _keyword_index = BM25Index(BM25_INDEX_PATH)
+    return _keyword_index
+
+def save_keyword_index():
+    """Persist the BM25 index if it changed. Batched ingestion calls this once per document."""
+    if _keyword_index is not None and _keyword_index.dirty:
+        _keyword_index.save()
+
+def flush_index():
+    """
+    Persist what upsert_embeddings buffered: the BM25 index and, for VECTOR_BACKEND=local, the
+    vector store. Batched ingestion calls this once per document.
+    """
+    save_keyword_index()
+    if VECTOR_BACKEND == "local" and _vector_store is not None and _vector_store.flush():
+        bump_index_version()
+
+def warm_up():
+    """Initialize every dependency now instead of on the first request."""
+    get_vector_store()
+    if HYBRID_SEARCH:
+        get_keyword_index()
+    get_splitter("python")
+    get_splitter("javascript")
+
+def readiness() -> dict:
+    """Report the state of each dependency and whether all of them are ready."""
+    deps = {
+        name: {k: v for k, v in status.items() if k != "since"}
+        for name, status in _status.items()
+    }
+    return {"ready": all(d["state"] == "ready" for d in deps.values()), "dependencies": deps}
 
 # 3. Text splitters for docs
-python_splitter = RecursiveCharacterTextSplitter.from_language(language=Language.PYTHON, chunk_size=512, chunk_overlap=0)
-javascript_splitter = RecursiveCharacterTextSplitter.from_language(language=Language.JS, chunk_size=256, chunk_overlap=0)
+
+def get_splitter(language: str):
+    if language not in ("python", "javascript"):
+        raise ValueError("Unsupported language for splitting.")
+    if language not in _splitters:
+        from langchain.text_splitter import Language, RecursiveCharacterTextSplitter
+        if language == "python":
+            _splitters[language] = RecursiveCharacterTextSplitter.from_language(language=Language.PYTHON, chunk_size=512, chunk_overlap=0)
+        else:
+            _splitters[language] = RecursiveCharacterTextSplitter.from_language(language=Language.JS, chunk_size=256, chunk_overlap=0)
+    return _splitters[language]
 
 # 4. Embed and index documentation
 
-def embed_and_index_docs(docs: list[str], language: str = "python"):
+# Pinecone accepts at most 1000 ids per delete request
+DELETE_BATCH_SIZE = 1000
+
+# Each doc language is indexed into its own namespace so retrieval only scans one partition
+LANGUAGE_NAMESPACES = {
+    "python": "python",
+    "javascript": "javascript",
+    "typescript": "javascript",
+}
+
+def namespace_for(language: str | None) -> str | None:
+    return LANGUAGE_NAMESPACES.get(language) if language else None
+
+def chunk_id(*parts) -> str:
+    """Deterministic chunk id from its content, so re-indexing the same chunk overwrites instead of duplicating."""
+    return hashlib.sha256("\x00".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+
+# Touched whenever the index changes, including from the separate ingest_docs process,
+# so servers know to drop cached retrieval results
+INDEX_VERSION_PATH = os.path.join(os.path.dirname(__file__), "data", "index_version")
+
+def bump_index_version():
+    global _index_version
+    with open(INDEX_VERSION_PATH, "w") as f:
+        f.write(str(time.time()))
+    result_cache.clear()
+    # This process already has the change in memory; only other processes need to reload
+    _index_version = os.stat(INDEX_VERSION_PATH).st_mtime_ns
+
+def upsert_chunks(texts: list[str], metadatas: list[dict], ids: list[str], namespace: str | None = None) -> bool:
     """
-    Embed and index documentation strings into Pinecone.
-    :param docs: List of documentation strings
-    :param language: 'python' or 'javascript'
+    Embed and upsert pre-split chunks under the given ids.
+    :return: True if the upsert succeeded
     """
+    vector_store = get_vector_store()
     if not vector_store:
         print("Pinecone vector store not initialized.")
-        return
-    if language == "python":
-        splitter = python_splitter
-    elif language == "javascript":
-        splitter = javascript_splitter
+        return False
+    if not texts:
+        return True
+    try:
+        vector_store.add_texts(texts, metadatas=metadatas, ids=ids, namespace=namespace)
+        get_keyword_index().add(ids, texts, namespace)
+        save_keyword_index()
+        bump_index_version()
+        return True
+    except Exception as e:
+        print(f"Error upserting to Pinecone: {e}")
+        return False
+
+def delete_chunks(ids: list[str], namespace: str | None = None) -> bool:
+    """
+    Delete chunks by id.
+    :return: True if every delete succeeded
+    """
+    vector_store = get_vector_store()
+    if not vector_store:
+        print("Pinecone vector store not initialized.")
+        return False
+    try:
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            vector_store.delete(ids=ids[start:start + DELETE_BATCH_SIZE], namespace=namespace)
+        get_keyword_index().delete(ids, namespace)
+        save_keyword_index()
+        bump_index_version()
+        return True
+    except Exception as e:
+        print(f"Error deleting from Pinecone: {e}")
+        return False
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embed a batch of document chunks. Raises on failure so callers can retry."""
+    embeddings = get_embeddings()
+    if embeddings is None:
+        raise RuntimeError("Embeddings not initialized.")
+    return embeddings.embed_documents(texts)
+
+def upsert_embeddings(texts: list[str], vectors: list[list[float]], metadatas: list[dict], ids: list[str],
+                      namespace: str | None = None):
+    """Upsert chunks whose embeddings were computed ahead of time. Raises on failure so callers can retry."""
+    vector_store = get_vector_store()
+    if not vector_store:
+        raise RuntimeError("Vector store not initialized.")
+    if VECTOR_BACKEND == "local":
+        # Buffered until flush_index(); rebuilding and rewriting the index per batch made ingestion quadratic
+        vector_store.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids, namespace=namespace, save=False)
     else:
-        raise ValueError("Unsupported language for splitting.")
+        # PineconeVectorStore keeps the chunk text in the "text" metadata field
+        _index.upsert(vectors=[
+            {"id": cid, "values": vector, "metadata": {**metadata, "text": text}}
+            for text, vector, metadata, cid in zip(texts, vectors, metadatas, ids)
+        ], namespace=namespace or "")
+    # Saved by the caller via flush_index(), so large ingests don't rewrite the file per batch
+    get_keyword_index().add(ids, texts, namespace)
+    if VECTOR_BACKEND != "local":
+        # Pinecone serves the new vectors right away; a local index only changes on disk when flushed
+        bump_index_version()
+
+def embed_and_index_docs(docs: list[str], language: str = "python"):
+    """
+    Embed and index documentation strings into the configured vector store.
+    Chunk ids are content hashes, so indexing the same docs twice does not duplicate vectors.
+    :param docs: List of documentation strings
+    :param language: 'python' or 'javascript'
+    """
+    splitter = get_splitter(language)
     texts = []
     metadatas = []
+    ids = []
     for doc in docs:
         for chunk in splitter.split_text(doc):
             texts.append(chunk)
             metadatas.append({"source": "doc", "language": language})
-    # Use vector_store.add_texts for upserting
-    try:
-        vector_store.add_texts(texts, metadatas=metadatas)
-    except Exception as e:
-        print(f"Error upserting to Pinecone: {e}")
+            ids.append(chunk_id(language, chunk))
+    upsert_chunks(texts, metadatas, ids, namespace=namespace_for(language))
 
 # 5. Retrieve relevant docs
 
-def retrieve_relevant_docs(query: str, top_k: int = 3):
+# Query text -> embedding. Keyed on normalized text so whitespace/case variants share an entry.
+embedding_cache = TTLCache(
+    maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL", 24 * 3600)),
+)
+# (embedding bucket, language, top_k) -> retrieved texts. Cleared whenever the index changes.
+result_cache = TTLCache(
+    maxsize=int(os.getenv("RESULT_CACHE_SIZE", 2048)),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", 3600)),
+)
+# Random hyperplanes for SimHash bucketing: near-identical embeddings land in the same bucket
+RESULT_CACHE_BUCKET_BITS = int(os.getenv("RESULT_CACHE_BUCKET_BITS", 64))
+_hyperplanes = None
+_index_version = None
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+def embed_query_cached(query: str) -> list[float]:
+    key = normalize_query(query)
+    vector = embedding_cache.get(key)
+    if vector is None:
+        with span("embed_query"):
+            vector = get_embeddings().embed_query(query)
+        embedding_cache.set(key, vector)
+    return vector
+
+def embedding_bucket(vector: list[float]) -> int:
+    """SimHash of the embedding: one bit per random hyperplane."""
+    import numpy as np
+    global _hyperplanes
+    if _hyperplanes is None:
+        rng = np.random.default_rng(0)
+        _hyperplanes = rng.standard_normal((RESULT_CACHE_BUCKET_BITS, len(vector)))
+    bits = (_hyperplanes @ np.asarray(vector)) > 0
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def check_index_version():
+    """
+    If another process changed the index since the last check, clear the result cache and
+    reload the indexes this process keeps in memory (the BM25 index and a local vector store).
+    """
+    global _index_version
+    try:
+        version = os.stat(INDEX_VERSION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        version = None
+    if version != _index_version:
+        result_cache.clear()
+        try:
+            if VECTOR_BACKEND == "local" and _vector_store is not None and os.path.exists(LOCAL_INDEX_PATH + ".json"):
+                _vector_store.load()
+            if _keyword_index is not None and os.path.exists(BM25_INDEX_PATH):
+                _keyword_index.load()
+        except (OSError, ValueError) as e:
+            # Most likely caught mid-write; the version is left unchanged so the next check retries
+            print(f"Error reloading the index: {e}")
+            return
+        _index_version = version
+
+def cache_stats() -> dict:
+    return {"embedding": embedding_cache.stats(), "retrieval": result_cache.stats()}
+
+def search_namespace(query_vector: list[float], k: int, namespace: str | None):
+    """Return (document, score) pairs from a single namespace."""
+    with span("vector_search"):
+        return get_vector_store().similarity_search_by_vector_with_score(query_vector, k=k, namespace=namespace)
+
+def hybrid_search(query: str, query_vector: list[float], k: int, namespaces: list[str | None]) -> list[str]:
     """
-    Retrieve top_k relevant docs from Pinecone for a given query.
+    Search the given namespaces with both the vector store and BM25 and return up to k texts,
+    best first. Without HYBRID_SEARCH only the vector ranking is used.
+    """
+    candidates = k * HYBRID_CANDIDATES if HYBRID_SEARCH else k
+    vector_hits = []
+    keyword_hits = []
+    for namespace in namespaces:
+        vector_hits.extend(search_namespace(query_vector, candidates, namespace))
+        if HYBRID_SEARCH:
+            with span("keyword_search"):
+                keyword_hits.extend(get_keyword_index().search(query, candidates, namespace))
+    vector_hits.sort(key=lambda hit: hit[1], reverse=True)
+    keyword_hits.sort(key=lambda hit: hit[1], reverse=True)
+    vector_ranking = list(dict.fromkeys(doc.page_content for doc, _ in vector_hits))
+    if not HYBRID_SEARCH:
+        return vector_ranking[:k]
+    keyword_ranking = [text for text, _ in keyword_hits]
+    return reciprocal_rank_fusion([vector_ranking, keyword_ranking], k=RRF_K)[:k]
+
+@span("retrieval")
+def retrieve_relevant_docs(query: str, top_k: int = 3, language: str | None = None, min_hits: int | None = None):
+    """
+    Retrieve top_k relevant docs for a given query, fusing vector and BM25 keyword rankings.
+    With a language, only that language's namespace is searched; if it yields fewer than
+    min_hits (default top_k) results, the remaining slots are filled from the other languages.
     :param query: Query string
     :param top_k: Number of docs to retrieve
+    :param language: Language of the user's code ('python', 'javascript', 'typescript')
+    :param min_hits: Minimum in-language hits before falling back to cross-language search
     :return: List of matched document texts
     """
-    if not vector_store:
+    if not get_vector_store():
         print("Pinecone vector store not initialized.")
         return []
     try:
-        results = vector_store.similarity_search(query, k=top_k)
-        return [doc.page_content for doc in results]
+        query_vector = embed_query_cached(query)
+        check_index_version()
+        cache_key = (embedding_bucket(query_vector), namespace_for(language), top_k, min_hits)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        namespace = namespace_for(language)
+        results = hybrid_search(query, query_vector, top_k, [namespace]) if namespace else []
+        if len(results) < (min_hits or top_k):
+            others = sorted(set(LANGUAGE_NAMESPACES.values()) - {namespace})
+            for text in hybrid_search(query, query_vector, top_k, others):
+                if text not in results:
+                    results.append(text)
+        result_cache.set(cache_key, results[:top_k])
+        return results[:top_k]
     except Exception as e:
         print(f"Error querying Pinecone: {e}")
         return []
@@ -99,7 +411,7 @@ def generate_explanation(code: str, output: str, error: str, retrieved_docs: lis
     """
     if not GROQ_API_KEY:
         return
-    llm = ChatGroq(api_key=SecretStr(GROQ_API_KEY), model="meta-llama/llama-4-scout-17b-16e-instruct")
+    llm = get_llm_client(GROQ_API_KEY)
     prompt = f"""
         You are a code tutor. Given the following code, output, error, and documentation, explain what happened and how to fix any issues.
 
@@ -0,0 +1,534 @@
+import asyncio
+import codecs
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from metrics import span
+
+# Languages the tutor can execute, mapped to the E2B code-context language name
+SUPPORTED_LANGUAGES = {
+    "python": "python",
+    "javascript": "js",
+    "typescript": "ts",
+}
+
+
+class SandboxPoolError(Exception):
+    """Raised when no sandbox can be checked out of the pool."""
+
+
+def _message_text(message) -> str:
+    # E2B passes OutputMessage objects to its stdout/stderr callbacks
+    return getattr(message, "line", None) or str(message)
+
+
+# --- Backends ---
+
+class E2BBackend:
+    """
+    Pool backend that hands out E2B sandboxes.
+    The code context is restarted between checkouts so no interpreter state leaks between runs.
+    """
+
+    def __init__(self, api_key: str | None = None, timeout: int = 300):
+        self.api_key = api_key or os.getenv("E2B_API_KEY")
+        self.timeout = timeout
+
+    def create(self, language: str):
+        # Imported here so building the pool at startup stays cheap
+        from e2b_code_interpreter import Sandbox
+        sbx = Sandbox(api_key=self.api_key, timeout=self.timeout)
+        return SimpleNamespace(sandbox=sbx, context=sbx.create_code_context(language=SUPPORTED_LANGUAGES[language]))
+
+    def reset(self, handle, language: str):
+        # Restarting reuses the context's kernel; creating a new context would leak one per run
+        handle.sandbox.restart_code_context(handle.context)
+        # Keep the remote sandbox alive for as long as it may sit idle in the pool
+        handle.sandbox.set_timeout(self.timeout)
+
+    def run(self, handle, code: str, language: str, timeout: float | None = None):
+        return handle.sandbox.run_code(code, context=handle.context, timeout=timeout)
+
+    def run_streaming(self, handle, code: str, language: str, on_stdout, on_stderr, timeout: float | None = None):
+        """Like run, but calls on_stdout/on_stderr with each chunk of output as it is produced."""
+        return handle.sandbox.run_code(
+            code,
+            context=handle.context,
+            timeout=timeout,
+            on_stdout=lambda message: on_stdout(_message_text(message)),
+            on_stderr=lambda message: on_stderr(_message_text(message)),
+        )
+
+    def interrupt(self, handle):
+        # Killing the sandbox aborts the in-flight run_code call
+        self.close(handle)
+
+    def is_healthy(self, handle) -> bool:
+        try:
+            return handle.sandbox.is_running()
+        except Exception:
+            return False
+
+    def close(self, handle):
+        try:
+            handle.sandbox.kill()
+        except Exception as e:
+            print(f"Error closing sandbox: {e}")
+
+
+class LocalSubprocessBackend:
+    """
+    Stand-in backend that runs code in a local subprocess.
+    Not isolated: meant for tests and offline development only.
+    """
+
+    COMMANDS = {
+        "python": ["python", "-c"],
+        "javascript": ["node", "-e"],
+        "typescript": ["npx", "--yes", "tsx", "-e"],
+    }
+
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+
+    def create(self, language: str):
+        return SimpleNamespace(language=language, closed=False, proc=None)
+
+    def reset(self, handle, language: str):
+        # Every run is a new process, so there is no state to reset
+        pass
+
+    def run(self, handle, code: str, language: str, timeout: float | None = None):
+        handle.proc = subprocess.Popen(
+            self.COMMANDS[language] + [code],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            stdout, stderr = handle.proc.communicate(timeout=timeout or self.timeout)
+        except subprocess.TimeoutExpired:
+            handle.proc.kill()
+            handle.proc.communicate()
+            raise
+        finally:
+            handle.proc = None
+        # Mirror the shape of an E2B execution so callers can treat both the same
+        return SimpleNamespace(logs=SimpleNamespace(stdout=[stdout], stderr=[stderr]))
+
+    def run_streaming(self, handle, code: str, language: str, on_stdout, on_stderr, timeout: float | None = None):
+        """Like run, but calls on_stdout/on_stderr with each chunk of output as it is read."""
+        handle.proc = subprocess.Popen(
+            self.COMMANDS[language] + [code],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            # Python block-buffers piped stdout, which would hold output back until exit
+            env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        )
+        proc = handle.proc
+
+        def pump(pipe, callback):
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while chunk := pipe.read1(4096):
+                text = decoder.decode(chunk)
+                if text:
+                    callback(text)
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                callback(tail)
+
+        readers = [
+            threading.Thread(target=pump, args=(proc.stdout, on_stdout), daemon=True),
+            threading.Thread(target=pump, args=(proc.stderr, on_stderr), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            proc.wait(timeout=timeout or self.timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+            handle.proc = None
+        return SimpleNamespace(logs=SimpleNamespace(stdout=[], stderr=[]))
+
+    def interrupt(self, handle):
+        proc = handle.proc
+        if proc is not None:
+            proc.kill()
+
+    def is_healthy(self, handle) -> bool:
+        return not handle.closed
+
+    def close(self, handle):
+        self.interrupt(handle)
+        handle.closed = True
+
+
+BACKENDS = {
+    "e2b": E2BBackend,
+    "local": LocalSubprocessBackend,
+}
+
+
+# --- Pool ---
+
+class SandboxPool:
+    """
+    Per-language pool of pre-warmed sandboxes.
+    :param backend: Object implementing create/reset/run/run_streaming/interrupt/is_healthy/close
+    :param min_idle: Number of idle sandboxes kept warm per language
+    :param max_size: Maximum number of sandboxes (idle + checked out) per language
+    :param idle_ttl: Seconds an idle sandbox may sit in the pool before it is evicted
+    :param checkout_timeout: Seconds to wait for a free slot when the pool is full
+    """
+
+    def __init__(self, backend, min_idle: int = 1, max_size: int = 4, idle_ttl: float = 240,
+                 checkout_timeout: float = 30, languages=None):
+        self.backend = backend
+        self.min_idle = min_idle
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.checkout_timeout = checkout_timeout
+        self.languages = list(languages or SUPPORTED_LANGUAGES)
+        self._idle = {lang: deque() for lang in self.languages}  # (handle, returned_at)
+        self._in_use = {lang: 0 for lang in self.languages}
+        self._creating = {lang: 0 for lang in self.languages}
+        self._checking = {lang: 0 for lang in self.languages}  # Idle sandboxes out for a health check
+        self._cond = threading.Condition()
+        self._closed = False
+        self._maintenance_thread = None
+
+    def _size(self, language: str) -> int:
+        return (len(self._idle[language]) + self._in_use[language] + self._creating[language]
+                + self._checking[language])
+
+    def warm_up(self):
+        """Fill every language up to min_idle sandboxes."""
+        for language in self.languages:
+            self._fill(language)
+
+    def _fill(self, language: str):
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle[language]) + self._creating[language] >= self.min_idle:
+                    return
+                if self._size(language) >= self.max_size:
+                    return
+                self._creating[language] += 1
+            handle = None
+            try:
+                handle = self.backend.create(language)
+            except Exception as e:
+                print(f"Error pre-warming {language} sandbox: {e}")
+            with self._cond:
+                self._creating[language] -= 1
+                if handle is not None and not self._closed:
+                    self._idle[language].append((handle, time.monotonic()))
+                self._cond.notify_all()
+            if handle is None:
+                return
+            if self._closed:
+                self.backend.close(handle)
+                return
+
+    def checkout(self, language: str):
+        """
+        Take a sandbox for language out of the pool, creating one if none is idle.
+        Blocks up to checkout_timeout when the pool is at max_size.
+        """
+        if language not in self._idle:
+            raise SandboxPoolError(f"Unsupported language: {language}")
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise SandboxPoolError("Sandbox pool is closed.")
+                handle = None
+                if self._idle[language]:
+                    # Counted as in use while its health is checked outside the lock
+                    handle, _ = self._idle[language].popleft()
+                    self._in_use[language] += 1
+                    create = False
+                elif self._size(language) < self.max_size:
+                    self._creating[language] += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise SandboxPoolError(f"No {language} sandbox available (pool size {self.max_size}).")
+                    self._cond.wait(remaining)
+                    continue
+            if not create:
+                if self.backend.is_healthy(handle):
+                    return handle
+                with self._cond:
+                    self._in_use[language] -= 1
+                    self._cond.notify_all()
+                self.backend.close(handle)
+                continue
+            try:
+                handle = self.backend.create(language)
+            except Exception:
+                with self._cond:
+                    self._creating[language] -= 1
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._creating[language] -= 1
+                self._in_use[language] += 1
+            return handle
+
+    def release(self, handle, language: str, discard: bool = False):
+        """
+        Return a sandbox to the pool after resetting its state.
+        Sandboxes that fail to reset or are unhealthy are closed instead.
+        """
+        if not discard:
+            try:
+                self.backend.reset(handle, language)
+                discard = not self.backend.is_healthy(handle)
+            except Exception as e:
+                print(f"Error resetting {language} sandbox: {e}")
+                discard = True
+        with self._cond:
+            self._in_use[language] -= 1
+            if not discard and not self._closed:
+                self._idle[language].append((handle, time.monotonic()))
+                handle = None
+            self._cond.notify_all()
+        if handle is not None:
+            self.backend.close(handle)
+
+    @contextmanager
+    def sandbox(self, language: str):
+        """Context manager wrapping checkout/release. Sandboxes that raise are discarded."""
+        handle = self.checkout(language)
+        try:
+            yield handle
+        except Exception:
+            self.release(handle, language, discard=True)
+            raise
+        self.release(handle, language)
+
+    def run(self, code: str, language: str, timeout: float | None = None):
+        """Run code in a pooled sandbox and return the backend's execution result."""
+        with self.sandbox(language) as handle:
+            return self.backend.run(handle, code, language, timeout=timeout)
+
+    async def checkout_async(self, language: str):
+        """
+        checkout without blocking the event loop. The checkout thread can't be stopped, so if
+        the awaiting task is cancelled the sandbox it ends up with is released in the background.
+        """
+        loop = asyncio.get_running_loop()
+        with span("sandbox_checkout"):
+            checkout = asyncio.ensure_future(asyncio.to_thread(self.checkout, language))
+            try:
+                return await asyncio.shield(checkout)
+            except asyncio.CancelledError:
+                def release_unused(task):
+                    if not task.cancelled() and task.exception() is None:
+                        loop.run_in_executor(None, self.release, task.result(), language)
+                checkout.add_done_callback(release_unused)
+                raise
+
+    def _discard(self, handle, language: str):
+        self.backend.interrupt(handle)
+        self.release(handle, language, discard=True)
+
+    def _discard_in_background(self, handle, language: str):
+        """Interrupt and discard a sandbox on a worker thread, for cancelled tasks that must not block."""
+        asyncio.get_running_loop().run_in_executor(None, self._discard, handle, language)
+
+    async def run_async(self, code: str, language: str, timeout: float | None = None):
+        """
+        Run code in a pooled sandbox without blocking the event loop.
+        Cancelling the awaiting task interrupts the run and discards the sandbox.
+        """
+        handle = await self.checkout_async(language)
+        try:
+            result = await asyncio.to_thread(self.backend.run, handle, code, language, timeout)
+        except asyncio.CancelledError:
+            self._discard_in_background(handle, language)
+            raise
+        except Exception:
+            await asyncio.to_thread(self.release, handle, language, True)
+            raise
+        await asyncio.to_thread(self.release, handle, language)
+        return result
+
+    async def run_streaming_async(self, code: str, language: str, on_output, time_limit: float,
+                                  max_output_bytes: int) -> dict:
+        """
+        Run code in a pooled sandbox, awaiting on_output(stream, text) for each chunk of
+        stdout/stderr as it is produced. Consecutive chunks that queue up while on_output is
+        busy are coalesced. The run is killed once it exceeds time_limit seconds or produces
+        more than max_output_bytes of output; output past the limit is dropped.
+        Cancelling the awaiting task interrupts the run and discards the sandbox.
+        :return: Summary with status ('completed', 'timeout', 'output_limit' or 'error'),
+            duration in seconds, stdout_bytes/stderr_bytes forwarded and error if the run failed
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        handle = await self.checkout_async(language)
+        started = time.monotonic()
+        sent = {"stdout": 0, "stderr": 0}
+        summary = {"status": "completed"}
+
+        def emit(stream):
+            return lambda text: loop.call_soon_threadsafe(queue.put_nowait, (stream, text))
+
+        # The backend's own timeout is a backstop in case interrupting fails
+        worker = asyncio.create_task(asyncio.to_thread(
+            self.backend.run_streaming, handle, code, language, emit("stdout"), emit("stderr"), time_limit + 5))
+
+        def on_worker_done(task):
+            if not task.cancelled():
+                task.exception()  # Retrieved here so an interrupted run doesn't log "never retrieved"
+            queue.put_nowait(done)
+
+        worker.add_done_callback(on_worker_done)
+        finished = cancelled = False
+        try:
+            while not finished:
+                remaining = time_limit - (time.monotonic() - started)
+                try:
+                    items = [await asyncio.wait_for(queue.get(), max(remaining, 0))]
+                except asyncio.TimeoutError:
+                    summary["status"] = "timeout"
+                    break
+                while not queue.empty():
+                    items.append(queue.get_nowait())
+                if items[-1] is done:
+                    items.pop()
+                    finished = True
+                # Merge runs of chunks from the same stream into one
+                merged = []
+                for stream, text in items:
+                    if merged and merged[-1][0] == stream:
+                        merged[-1][1] += text
+                    else:
+                        merged.append([stream, text])
+                for stream, text in merged:
+                    budget = max_output_bytes - sent["stdout"] - sent["stderr"]
+                    data = text.encode("utf-8")
+                    if len(data) > budget:
+                        text = data[:budget].decode("utf-8", errors="ignore")
+                        summary["status"] = "output_limit"
+                    if text:
+                        sent[stream] += len(text.encode("utf-8"))
+                        await on_output(stream, text)
+                    if summary["status"] == "output_limit":
+                        break
+                if summary["status"] == "output_limit":
+                    break
+            if finished:
+                try:
+                    worker.result()
+                except Exception as e:
+                    summary = {"status": "error", "error": str(e)}
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if cancelled:
+                self._discard_in_background(handle, language)
+            elif not finished:
+                # Timed out, hit the output limit or on_output failed while the run was still going
+                await asyncio.to_thread(self._discard, handle, language)
+            else:
+                await asyncio.to_thread(self.release, handle, language, summary["status"] == "error")
+        summary["duration"] = round(time.monotonic() - started, 3)
+        summary["stdout_bytes"] = sent["stdout"]
+        summary["stderr_bytes"] = sent["stderr"]
+        return summary
+
+    def evict_idle(self):
+        """Close sandboxes idle longer than idle_ttl or failing their health check, then refill."""
+        now = time.monotonic()
+        to_close = []
+        with self._cond:
+            for language, idle in self._idle.items():
+                keep = deque()
+                for handle, returned_at in idle:
+                    if now - returned_at > self.idle_ttl:
+                        to_close.append(handle)
+                    else:
+                        keep.append((handle, returned_at))
+                self._idle[language] = keep
+        for handle in to_close:
+            self.backend.close(handle)
+        for language in self.languages:
+            healthy = deque()
+            with self._cond:
+                idle = self._idle[language]
+                self._idle[language] = deque()
+                self._checking[language] += len(idle)
+            for handle, returned_at in idle:
+                if self.backend.is_healthy(handle):
+                    healthy.append((handle, returned_at))
+                else:
+                    self.backend.close(handle)
+                    with self._cond:
+                        self._checking[language] -= 1
+                        self._cond.notify_all()
+            with self._cond:
+                self._idle[language].extendleft(reversed(healthy))
+                self._checking[language] -= len(healthy)
+                self._cond.notify_all()
+        self.warm_up()
+
+    def start_maintenance(self, interval: float = 30):
+        """Run evict_idle every interval seconds on a daemon thread."""
+        def worker():
+            while not self._closed:
+                time.sleep(interval)
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    print(f"[SandboxPool] Maintenance error: {e}")
+        self._maintenance_thread = threading.Thread(target=worker, daemon=True)
+        self._maintenance_thread.start()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                language: {"idle": len(self._idle[language]), "in_use": self._in_use[language]}
+                for language in self.languages
+            }
+
+    def close(self):
+        """Close every idle sandbox. Checked-out sandboxes are closed when released."""
+        with self._cond:
+            self._closed = True
+            handles = [h for idle in self._idle.values() for h, _ in idle]
+            for language in self.languages:
+                self._idle[language].clear()
+            self._cond.notify_all()
+        for handle in handles:
+            self.backend.close(handle)
+
+
+def create_sandbox_pool_from_env() -> SandboxPool:
+    """
+    Build a SandboxPool configured from environment variables:
+    SANDBOX_BACKEND (e2b|local), SANDBOX_POOL_MIN_IDLE, SANDBOX_POOL_MAX_SIZE, SANDBOX_POOL_IDLE_TTL.
+    """
+    backend_name = os.getenv("SANDBOX_BACKEND", "e2b")
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown SANDBOX_BACKEND: {backend_name}")
+    return SandboxPool(
+        BACKENDS[backend_name](),
+        min_idle=int(os.getenv("SANDBOX_POOL_MIN_IDLE", 1)),
+        max_size=int(os.getenv("SANDBOX_POOL_MAX_SIZE", 4)),
+        idle_ttl=float(os.getenv("SANDBOX_POOL_IDLE_TTL", 240)),
+    )
@@ -0,0 +1,68 @@
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_splits_dotted_identifiers():
+    tokens = tokenize("Array.prototype.reduce")
+    assert tokens[0] == "array.prototype.reduce"
+    assert {"array", "prototype", "reduce"} <= set(tokens)
+
+
+def test_tokenize_splits_camel_and_snake_case():
+    assert set(tokenize("TypeError")) == {"typeerror", "type", "error"}
+    assert set(tokenize("type error")) == {"type", "error"}
+    assert {"json", "parse", "error"} <= set(tokenize("JSONParseError"))
+    assert {"read_csv", "read", "csv"} == set(tokenize("read_csv"))
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("what is the map function") == ["map", "function"]
+
+
+def make_index(path=None):
+    index = BM25Index(path)
+    index.add(["reduce", "map", "error"], [
+        "Array.prototype.reduce() executes a reducer function on each element",
+        "Array.prototype.map() creates a new array from calling a function on every element",
+        "A TypeError is thrown when an operation is performed on a value of the wrong type",
+    ], namespace="javascript")
+    return index
+
+
+def test_search_ranks_identifier_matches():
+    index = make_index()
+    assert index.search("reduce", namespace="javascript")[0][0].startswith("Array.prototype.reduce")
+    assert index.search("type error", namespace="javascript")[0][0].startswith("A TypeError")
+    assert index.search("reduce", namespace="python") == []
+    assert index.search("nothing matches", namespace="javascript") == []
+
+
+def test_search_respects_k():
+    index = make_index()
+    assert len(index.search("array element function", k=2, namespace="javascript")) == 2
+
+
+def test_delete_and_upsert():
+    index = make_index()
+    index.delete(["reduce"], namespace="javascript")
+    assert index.search("reducer", namespace="javascript") == []
+    assert index.missing(["reduce", "map"], namespace="javascript") == ["reduce"]
+    index.add(["map"], ["Array.prototype.flatMap() maps then flattens"], namespace="javascript")
+    assert index.search("creates", namespace="javascript") == []
+    assert index.search("flatmap", namespace="javascript")[0][0].startswith("Array.prototype.flatMap")
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "bm25_index.json")
+    index = make_index(path)
+    assert index.dirty
+    index.save()
+    assert not index.dirty
+    loaded = BM25Index(path)
+    assert loaded.search("type error", namespace="javascript") == index.search("type error", namespace="javascript")
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]])
+    assert fused[:2] == ["b", "c"]
+    assert set(fused) == {"a", "b", "c", "d"}
+    assert reciprocal_rank_fusion([]) == []
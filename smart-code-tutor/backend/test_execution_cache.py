@@ -0,0 +1,36 @@
+import pytest
+
+from execution_cache import is_cacheable
+
+
+@pytest.mark.parametrize("code", [
+    "import random\nprint(random.random())",
+    "import math, random\nprint(random.randint(1, 6))",
+    "import numpy as np\nprint(np.random.rand())",
+    "from numpy import random\nprint(random.rand())",
+    "from numpy.random import default_rng\nprint(default_rng().random())",
+    "import os.path\nprint(os.path.exists('x'))",
+    "from time import perf_counter\nprint(perf_counter())",
+    "print(input())",
+    "print(set('abc'))",
+    "print({'a', 'b', 'c'})",
+    "print({c for c in 'abc'})",
+])
+def test_nondeterministic_python_is_not_cacheable(code):
+    assert not is_cacheable(code, "python")
+
+
+@pytest.mark.parametrize("code", [
+    "import math\nprint(math.sqrt(2))",
+    "import numpy as np\nprint(np.arange(3).sum())",
+    "print(sorted({'b': 1, 'a': 2}))",
+    "def f(:\n    pass",
+])
+def test_deterministic_python_is_cacheable(code):
+    assert is_cacheable(code, "python")
+
+
+def test_javascript_patterns():
+    assert not is_cacheable("console.log(Math.random())", "javascript")
+    assert is_cacheable("console.log([3, 1, 2].sort())", "typescript")
+    assert not is_cacheable("print(1)", "ruby")
@@ -0,0 +1,30 @@
+from intent_classifier import (DEFAULT_CONFIDENCE_THRESHOLD, HELDOUT_FILE, choose_threshold, get_classifier,
+                               load_examples)
+
+
+def test_heldout_accuracy():
+    classifier = get_classifier()
+    examples = load_examples(HELDOUT_FILE)
+    correct = sum(classifier.predict(text)[0] == label for text, label in examples)
+    assert correct / len(examples) >= 0.9
+
+
+def test_confident_heldout_predictions_are_correct():
+    classifier = get_classifier()
+    for text, label in load_examples(HELDOUT_FILE):
+        predicted, confidence = classifier.predict(text)
+        if confidence >= DEFAULT_CONFIDENCE_THRESHOLD:
+            assert predicted == label, (text, predicted, confidence)
+
+
+def test_default_threshold_is_at_least_the_heldout_choice():
+    assert DEFAULT_CONFIDENCE_THRESHOLD >= choose_threshold(get_classifier(), load_examples(HELDOUT_FILE))
+
+
+def test_misclassified_request_falls_back_to_llm():
+    label, confidence = get_classifier().predict("print hello world in python")
+    assert label == "generate" or confidence < DEFAULT_CONFIDENCE_THRESHOLD
+
+
+def test_unknown_words_have_no_confidence():
+    assert get_classifier().predict("zzz qqq") == ("other", 0.0)
@@ -0,0 +1,74 @@
+import numpy as np
+
+import rag_engine
+from local_vector_store import LocalVectorStore
+
+
+class FakeEmbeddings:
+    """Deterministic random unit vectors per text."""
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % 2**32)
+        return rng.standard_normal(16).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_search_finds_added_text(tmp_path):
+    store = LocalVectorStore(FakeEmbeddings(), str(tmp_path / "index"))
+    store.add_texts(["alpha", "beta", "gamma"], ids=["a", "b", "g"], namespace="python")
+    doc, score = store.similarity_search_by_vector_with_score(FakeEmbeddings().embed_query("beta"), k=1,
+                                                              namespace="python")[0]
+    assert doc.page_content == "beta"
+    assert score > 0.99
+    assert store.similarity_search_by_vector_with_score(FakeEmbeddings().embed_query("beta"), namespace="js") == []
+
+
+def test_reader_reloads_when_another_process_changes_the_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "index")
+    writer = LocalVectorStore(FakeEmbeddings(), path)
+    writer.add_texts(["alpha"], ids=["a"])
+    reader = LocalVectorStore(FakeEmbeddings(), path)
+    monkeypatch.setattr(rag_engine, "VECTOR_BACKEND", "local")
+    monkeypatch.setattr(rag_engine, "LOCAL_INDEX_PATH", path)
+    monkeypatch.setattr(rag_engine, "INDEX_VERSION_PATH", str(tmp_path / "index_version"))
+    monkeypatch.setattr(rag_engine, "BM25_INDEX_PATH", str(tmp_path / "bm25.json"))
+    monkeypatch.setattr(rag_engine, "_vector_store", reader)
+    monkeypatch.setattr(rag_engine, "_keyword_index", None)
+    rag_engine.check_index_version()
+
+    writer.add_texts(["beta"], ids=["b"])
+    with open(rag_engine.INDEX_VERSION_PATH, "w") as f:
+        f.write("changed")
+    assert reader.ids == ["a"]
+    rag_engine.check_index_version()
+    assert reader.ids == ["a", "b"]
+
+
+def test_buffered_writes_are_searchable_and_saved_on_flush(tmp_path):
+    path = str(tmp_path / "index")
+    embeddings = FakeEmbeddings()
+    store = LocalVectorStore(embeddings, path, mode="ivf", n_lists=2, n_probe=2)
+    for batch in range(3):
+        texts = [f"text {batch} {i}" for i in range(4)]
+        store.add_embeddings(texts, embeddings.embed_documents(texts), ids=texts, save=False)
+    assert not (tmp_path / "index.json").exists()
+    doc = store.similarity_search_by_vector(embeddings.embed_query("text 2 3"), k=1)[0]
+    assert doc.page_content == "text 2 3"
+
+    # Upserting an id replaces its row, including one that is still buffered
+    store.add_embeddings(["text 2 3"], embeddings.embed_documents(["other"]), ids=["text 2 3"], save=False)
+    assert store.flush()
+    assert not store.flush()
+    reloaded = LocalVectorStore(embeddings, path)
+    assert len(reloaded.ids) == 12
+    doc = reloaded.similarity_search_by_vector(embeddings.embed_query("other"), k=1)[0]
+    assert doc.page_content == "text 2 3"
+
+
+def test_delete_removes_rows(tmp_path):
+    store = LocalVectorStore(FakeEmbeddings(), str(tmp_path / "index"))
+    store.add_texts(["alpha", "beta"], ids=["a", "b"])
+    store.delete(ids=["a", "missing"])
+    assert LocalVectorStore(FakeEmbeddings(), str(tmp_path / "index")).ids == ["b"]
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from sandbox_pool import LocalSubprocessBackend, SandboxPool
+
+
+class SlowWebSocket:
+    """Collects sent frames; sends block forever once `stall` is set."""
+
+    def __init__(self, stall: bool = False):
+        self.stall = stall
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(json.loads(text))
+        if self.stall and len(self.frames) > 1:
+            await asyncio.Event().wait()
+
+
+def test_send_stream_forwards_tokens():
+    async def tokens():
+        for token in ["a", "b", "c"]:
+            yield token
+
+    async def scenario():
+        websocket = SlowWebSocket()
+        text = await main.send_stream(websocket, "r1", tokens(), intent="explain")
+        assert text == "abc"
+        assert websocket.frames[0] == {"type": "start", "request_id": "r1", "intent": "explain"}
+        assert websocket.frames[-1]["explanation"] == "abc"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_send_stream_closes_the_token_generator():
+    closed = asyncio.Event()
+
+    async def tokens():
+        try:
+            while True:
+                yield "x"
+        finally:
+            closed.set()
+
+    async def scenario():
+        task = asyncio.create_task(main.send_stream(SlowWebSocket(stall=True), "r1", tokens()))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert closed.is_set()
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def local_pool(monkeypatch):
+    pool = SandboxPool(LocalSubprocessBackend(timeout=10), languages=["python"], min_idle=0, max_size=1)
+    monkeypatch.setattr(main, "sandbox_pool", pool)
+    main.execution_cache.clear()
+    yield pool
+    main.execution_cache.clear()
+
+
+CODE = "print('a')\nprint('b')"
+
+
+def test_cached_run_replays_as_stream(local_pool):
+    async def scenario():
+        assert await main.execute_code_async(CODE, "python") == ("a\nb\n", "", False)
+        websocket = SlowWebSocket()
+        summary = await main.stream_execution(websocket, "r1", CODE, "python")
+        assert websocket.frames == [{"type": "stdout", "request_id": "r1", "data": "a\nb\n"}]
+        assert summary["cached"] and summary["stdout_bytes"] == 4 and summary["stderr_bytes"] == 0
+        assert {"status", "duration"} <= summary.keys()
+
+    asyncio.run(scenario())
+
+
+def test_streamed_run_is_cached_as_strings(local_pool):
+    async def scenario():
+        summary = await main.stream_execution(SlowWebSocket(), "r1", CODE, "python")
+        assert summary["status"] == "completed" and not summary["cached"]
+        assert await main.execute_code_async(CODE, "python") == ("a\nb\n", "", True)
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_request_id_is_rejected(local_pool, monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    with TestClient(main.app).websocket_connect("/ws") as websocket:
+        request = {"action": "run", "language": "python", "request_id": "r1",
+                   "code": "import time\ntime.sleep(0.5)\nprint('done')"}
+        websocket.send_text(json.dumps(request))
+        websocket.send_text(json.dumps(request))
+        assert websocket.receive_json() == {"request_id": "r1", "error": "Request r1 is already in flight."}
+        response = websocket.receive_json()
+        assert response["request_id"] == "r1" and response["output"] == "done\n"
+
+
+def test_failed_stages_degrade_explain(monkeypatch):
+    async def failing_intent(user_message, groq_api_key):
+        raise RuntimeError("LLM unavailable")
+
+    def failing_retrieval(query, top_k, language):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(main, "detect_intent", failing_intent)
+    monkeypatch.setattr(main, "retrieve_relevant_docs", failing_retrieval)
+    intent, prompt, degraded, tokens = asyncio.run(
+        main.prepare_explain("print(1)", "python", "1\n", "", "what does this do?", "test"))
+    assert intent == "other"
+    assert degraded == ["intent", "retrieval"]
+    assert "what does this do?" in prompt
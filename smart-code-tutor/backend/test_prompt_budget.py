@@ -0,0 +1,81 @@
+from prompt_budget import PromptBudget, count_tokens, dedupe_docs, fit_docs, trim_head_tail, trim_traceback
+
+
+def test_count_tokens():
+    assert count_tokens("") == 0
+    assert count_tokens("print(x)") == 5
+    assert count_tokens("internationalization") == 5
+
+
+def test_trim_head_tail_keeps_both_ends():
+    text = "\n".join(f"line {i}" for i in range(200))
+    trimmed = trim_head_tail(text, 60)
+    lines = trimmed.splitlines()
+    assert count_tokens(trimmed) <= 60
+    assert lines[0] == "line 0" and lines[-1] == "line 199"
+    assert any("lines omitted" in line for line in lines)
+    assert trim_head_tail("short", 60) == "short"
+
+
+def test_trim_head_tail_single_long_line_keeps_its_end():
+    text = "x" * 1000 + "END"
+    trimmed = trim_head_tail(text, 20)
+    assert trimmed.startswith("... ") and trimmed.endswith("END")
+
+
+PY_TRACEBACK = "\n".join(
+    ["Traceback (most recent call last):"]
+    + [f'  File "/app/module_{i}.py", line {i + 1}, in func_{i}\n    call_{i}(argument_{i})' for i in range(40)]
+    + ['  File "/app/innermost.py", line 7, in divide\n    return a / b', "ZeroDivisionError: division by zero"]
+)
+
+
+def test_trim_traceback_keeps_innermost_frame_and_message():
+    trimmed = trim_traceback(PY_TRACEBACK, 80)
+    assert '  File "/app/innermost.py", line 7, in divide' in trimmed
+    assert "    return a / b" in trimmed
+    assert trimmed.splitlines()[-1] == "ZeroDivisionError: division by zero"
+    assert count_tokens(trimmed) < count_tokens(PY_TRACEBACK)
+
+
+def test_trim_traceback_javascript_stack():
+    stack = "\n".join(["TypeError: x is not a function", "    at inner (/app/a.js:3:5)"]
+                      + [f"    at frame{i} (/app/b.js:{i}:1)" for i in range(100)])
+    trimmed = trim_traceback(stack, 40)
+    assert "at inner (/app/a.js:3:5)" in trimmed
+    assert "TypeError: x is not a function" in trimmed
+
+
+def test_dedupe_docs_drops_duplicates_and_overlaps():
+    a = "list comprehensions build a new list from an iterable in a single expression"
+    b = "dict views reflect changes to the dictionary they were created from"
+    overlapping = a.replace("single expression", "single readable expression")
+    assert dedupe_docs([a, " " + a + " ", b, overlapping, ""]) == [a, b]
+
+
+def test_dedupe_docs_longer_chunk_replaces_contained_one():
+    short = "the with statement wraps a block in a context manager"
+    longer = "Intro. " + short + " so files are closed even when an exception is raised."
+    other = "generators produce values lazily with the yield keyword"
+    assert dedupe_docs([short, other, longer]) == [longer, other]
+    # The contained chunk coming second is simply dropped
+    assert dedupe_docs([longer, short]) == [longer]
+
+
+def test_fit_docs_truncates_the_first_doc_that_does_not_fit():
+    docs = ["word " * 20, "word " * 200, "word " * 5]
+    fitted = fit_docs(docs, 100)
+    assert fitted[0] == docs[0]
+    assert len(fitted) == 2 and "lines omitted" not in fitted[1] and count_tokens(fitted[1]) <= 80
+
+
+def test_prompt_budget_report():
+    budget = PromptBudget(max_tokens=200, budgets={"code": 10, "docs": 100})
+    code = budget.text("code", "x = 1\n" * 50)
+    output = budget.text("output", "ok")
+    docs = budget.docs(["some documentation text", "some documentation text"])
+    report = budget.report(code + output + docs)
+    assert docs == "some documentation text"
+    assert report["sections"] == {"code": count_tokens(code), "output": 1, "docs": count_tokens(docs)}
+    assert report["trimmed"] == ["code", "docs"]
+    assert report["prompt"] == count_tokens(code + output + docs)
@@ -0,0 +1,213 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from sandbox_pool import LocalSubprocessBackend, SandboxPool, SandboxPoolError
+
+
+class StubBackend:
+    """Records calls; runs sleep for `latency` seconds unless interrupted."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.created = 0
+        self.closed = []
+        self.unhealthy = set()
+
+    def create(self, language):
+        self.created += 1
+        return SimpleNamespace(id=self.created, interrupted=threading.Event())
+
+    def reset(self, handle, language):
+        handle.interrupted.clear()
+
+    def run(self, handle, code, language, timeout=None):
+        if handle.interrupted.wait(self.latency):
+            raise RuntimeError("Interrupted")
+        return code
+
+    def interrupt(self, handle):
+        handle.interrupted.set()
+
+    def is_healthy(self, handle):
+        return handle.id not in self.unhealthy
+
+    def close(self, handle):
+        self.closed.append(handle.id)
+
+
+def make_pool(backend=None, **kwargs):
+    kwargs.setdefault("min_idle", 0)
+    kwargs.setdefault("max_size", 2)
+    kwargs.setdefault("checkout_timeout", 0.2)
+    return SandboxPool(backend or StubBackend(), languages=["python"], **kwargs)
+
+
+def test_release_returns_sandbox_for_reuse():
+    pool = make_pool()
+    handle = pool.checkout("python")
+    assert pool.stats() == {"python": {"idle": 0, "in_use": 1}}
+    pool.release(handle, "python")
+    assert pool.stats() == {"python": {"idle": 1, "in_use": 0}}
+    assert pool.checkout("python") is handle
+    assert pool.backend.created == 1
+
+
+def test_checkout_skips_unhealthy_idle_sandbox():
+    pool = make_pool()
+    handle = pool.checkout("python")
+    pool.release(handle, "python")
+    pool.backend.unhealthy.add(handle.id)
+    replacement = pool.checkout("python")
+    assert replacement is not handle
+    assert pool.backend.closed == [handle.id]
+    assert pool.stats() == {"python": {"idle": 0, "in_use": 1}}
+
+
+def test_checkout_times_out_when_pool_is_full():
+    pool = make_pool(max_size=1)
+    pool.checkout("python")
+    with pytest.raises(SandboxPoolError):
+        pool.checkout("python")
+
+
+def test_checkout_waits_for_release():
+    pool = make_pool(max_size=1, checkout_timeout=2)
+    handle = pool.checkout("python")
+    threading.Timer(0.1, pool.release, args=(handle, "python")).start()
+    assert pool.checkout("python") is handle
+
+
+def test_discarded_sandbox_is_closed_and_frees_its_slot():
+    pool = make_pool(max_size=1)
+    handle = pool.checkout("python")
+    pool.release(handle, "python", discard=True)
+    assert pool.backend.closed == [handle.id]
+    assert pool.stats() == {"python": {"idle": 0, "in_use": 0}}
+    pool.checkout("python")
+
+
+def test_warm_up_fills_min_idle():
+    pool = make_pool(min_idle=2)
+    pool.warm_up()
+    assert pool.stats() == {"python": {"idle": 2, "in_use": 0}}
+
+
+def test_evict_idle_closes_expired_and_unhealthy_sandboxes():
+    pool = make_pool(idle_ttl=0.05)
+    first, second = pool.checkout("python"), pool.checkout("python")
+    pool.release(first, "python")
+    time.sleep(0.1)
+    pool.release(second, "python")
+    pool.evict_idle()
+    assert pool.backend.closed == [first.id]
+    pool.backend.unhealthy.add(second.id)
+    pool.evict_idle()
+    assert pool.backend.closed == [first.id, second.id]
+    assert pool.stats() == {"python": {"idle": 0, "in_use": 0}}
+
+
+def test_run_with_local_backend():
+    pool = make_pool(LocalSubprocessBackend(timeout=10))
+    result = pool.run("print('hello')", "python")
+    assert result.logs.stdout == ["hello\n"]
+    assert pool.stats() == {"python": {"idle": 1, "in_use": 0}}
+
+
+def test_cancelled_run_discards_its_sandbox():
+    async def scenario():
+        pool = make_pool(StubBackend(latency=5), max_size=1)
+        task = asyncio.create_task(pool.run_async("x", "python"))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.1)
+        assert pool.stats() == {"python": {"idle": 0, "in_use": 0}}
+        pool.backend.latency = 0
+        assert await pool.run_async("y", "python") == "y"
+
+    asyncio.run(scenario())
+
+
+def test_cancel_during_checkout_releases_the_sandbox():
+    async def scenario():
+        pool = make_pool(max_size=1, checkout_timeout=2)
+        held = pool.checkout("python")
+        task = asyncio.create_task(pool.run_async("x", "python"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        # The checkout thread is still waiting; it gets the sandbox once it is released
+        pool.release(held, "python")
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.2)
+        assert pool.stats() == {"python": {"idle": 1, "in_use": 0}}
+        assert await pool.run_async("y", "python") == "y"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_streaming_run_discards_its_sandbox():
+    async def scenario():
+        pool = make_pool(LocalSubprocessBackend(timeout=10), max_size=1)
+        received = []
+
+        async def on_output(stream, text):
+            received.append(text)
+
+        task = asyncio.create_task(pool.run_streaming_async(
+            "import time\nprint('start')\ntime.sleep(5)", "python", on_output, time_limit=10,
+            max_output_bytes=1000))
+        while not received:
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.2)
+        assert pool.stats() == {"python": {"idle": 0, "in_use": 0}}
+
+    asyncio.run(scenario())
+
+
+def test_streaming_run_is_killed_at_time_limit():
+    async def scenario():
+        pool = make_pool(LocalSubprocessBackend(timeout=10), max_size=1)
+
+        async def on_output(stream, text):
+            pass
+
+        summary = await pool.run_streaming_async("import time\ntime.sleep(5)", "python", on_output,
+                                                 time_limit=0.5, max_output_bytes=1000)
+        assert summary["status"] == "timeout"
+        assert pool.stats() == {"python": {"idle": 0, "in_use": 0}}
+
+    asyncio.run(scenario())
+
+
+def test_health_checks_during_eviction_count_towards_max_size():
+    pool = make_pool(max_size=2, checkout_timeout=2)
+    first, second = pool.checkout("python"), pool.checkout("python")
+    pool.release(first, "python")
+    pool.release(second, "python")
+    checking = threading.Event()
+    is_healthy = pool.backend.is_healthy
+
+    def slow_is_healthy(handle):
+        checking.set()
+        time.sleep(0.2)
+        return is_healthy(handle)
+
+    pool.backend.is_healthy = slow_is_healthy
+    maintenance = threading.Thread(target=pool.evict_idle)
+    maintenance.start()
+    checking.wait()
+    pool.backend.is_healthy = is_healthy
+    handles = {pool.checkout("python").id, pool.checkout("python").id}
+    maintenance.join()
+    assert handles == {first.id, second.id}
+    assert pool.backend.created == 2
+    assert pool.stats() == {"python": {"idle": 0, "in_use": 2}}
@@ -12,7 +12,7 @@ function App() {
   const [output, setOutput] = useState('');
   const [error, setError] = useState('');
   const [explanation, setExplanation] = useState('');
-  const [chat, setChat] = useState<Array<{ role: string; content: string }>>([]);
+  const [chat, setChat] = useState<Array<{ role: string; content: string; requestId?: string }>>([]);
   const [chatInput, setChatInput] = useState('');
   const wsRef = useRef<WebSocket | null>(null);
   const [llmCodeBlocks, setLlmCodeBlocks] = useState<string[]>([]);
@@ -31,6 +31,50 @@ function App() {
     wsRef.current.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
+        // For streamed EXPLAIN frames: start/delta/end tagged with request_id
+        if (data.type === 'start') {
+          setChat((prev) => [
+            ...prev,
+            { role: 'explanation', content: '', requestId: data.request_id }
+          ]);
+          return;
+        }
+        if (data.type === 'delta') {
+          setChat((prev) => prev.map((msg) =>
+            msg.requestId === data.request_id ? { ...msg, content: msg.content + data.delta } : msg
+          ));
+          return;
+        }
+        if (data.type === 'end') {
+          setExplanation(data.explanation || '');
+          setLlmCodeBlocks(extractAllCodeBlocks(data.explanation || ''));
+          setChat((prev) => [
+            ...prev.map((msg) =>
+              msg.requestId === data.request_id ? { ...msg, content: data.explanation || '' } : msg
+            ),
+            ...(data.error ? [{ role: 'error', content: data.error }] : [])
+          ]);
+          return;
+        }
+        // For streamed RUN frames: stdout/stderr chunks, then an exit summary
+        if (data.type === 'stdout') {
+          setOutput((prev) => prev + data.data);
+          return;
+        }
+        if (data.type === 'stderr') {
+          setError((prev) => prev + data.data);
+          return;
+        }
+        if (data.type === 'exit') {
+          if (data.status === 'timeout') {
+            setError((prev) => prev + `\n[Run stopped after ${data.duration}s: time limit exceeded]`);
+          } else if (data.status === 'output_limit') {
+            setError((prev) => prev + '\n[Run stopped: output limit exceeded]');
+          } else if (data.status === 'error') {
+            setError((prev) => prev + (data.error || 'Run failed'));
+          }
+          return;
+        }
         // For RUN action
         if ('output' in data || 'error' in data) {
           setOutput(data.output || '');
@@ -72,7 +116,7 @@ function App() {
       setOutput('');
       setError('');
       setExplanation('');
-      wsRef.current?.send(JSON.stringify({ action: 'run', code, language }));
+      wsRef.current?.send(JSON.stringify({ action: 'run', stream: true, code, language, request_id: crypto.randomUUID() }));
     }, 100); // ensure connection is open
   };
 
@@ -87,6 +131,8 @@ function App() {
       wsRef.current?.send(
         JSON.stringify({
           action: 'explain',
+          stream: true,
+          request_id: crypto.randomUUID(),
           code,
           language,
           output,
@@ -164,7 +164,7 @@ async def get_recommendations(user_query: str = "What stocks should I buy today?
         context += f"Error fetching {symbol} price: {stock_data['error']}\n"
     context += f"Relevant News: {relevant_docs}\n"
     try:
-        recommendation = generate_recommendation(context, [])
+        recommendation = await generate_recommendation(context, [])
         return {"recommendation": str(getattr(recommendation, 'content', recommendation))}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Recommendation generation error: {str(e)}") 
\ No newline at end of file
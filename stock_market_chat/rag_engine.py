@@ -2,10 +2,9 @@ import os
 from pinecone import Pinecone, ServerlessSpec
 from langchain_pinecone import PineconeVectorStore
 from langchain_nomic import NomicEmbeddings
-from langchain_groq import ChatGroq
 from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
 from langchain.schema import Document
-from pydantic.types import SecretStr
+from llm_client import get_llm_client
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -57,13 +56,13 @@ def retrieve_relevant_docs(query: str, top_k: int = 3):
         return []
 
 # 4. Generate stock recommendation using Groq LLM and retrieved docs
-def generate_recommendation(user_query: str, retrieved_docs: list[str]):
+async def generate_recommendation(user_query: str, retrieved_docs: list[str]):
     """
     Generate a stock recommendation using Groq LLM and relevant docs.
     """
     if not GROQ_API_KEY:
         return "Groq API key not set."
-    llm = ChatGroq(api_key=SecretStr(GROQ_API_KEY), model="meta-llama/llama-4-scout-17b-16e-instruct")
+    llm = get_llm_client(GROQ_API_KEY)
     prompt = f"""
 You are a financial assistant. Given the following user query and relevant market/news data, provide a personalized stock recommendation with reasoning.
 
@@ -75,6 +74,7 @@ Relevant Data:
 
 Recommendation:
 """
-    return llm.invoke(prompt)
+    # ainvoke waits for rate limits and retry backoff without blocking the event loop
+    return await llm.ainvoke(prompt)
 
 # TODO: Add document ingestion and indexing for news, analyst reports, and market data 
\ No newline at end of file